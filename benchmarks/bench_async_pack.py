@@ -0,0 +1,102 @@
+"""Asynchronous pack benchmark
+
+Sends messages over many local socketpair connections at once, packing
+each message either with pack() and a single write, or with write_to().
+Reports the message rate, throughput and the worst event loop stall,
+measured by a task that asks to be woken every millisecond.
+
+    python -m benchmarks.bench_async_pack [--connections N] [--messages N]
+        [--leaves N] [--payload BYTES]
+"""
+import argparse
+import asyncio
+import socket
+import time
+
+from dataforge import DFBuffer, DFContainer, DFLength, DFUInt16, DFUInt32
+
+
+def build(leaves: int, payload: int) -> DFContainer:
+    message = DFContainer()
+    message.seq = DFUInt32()
+    message.body = DFLength(DFUInt32(), DFContainer())
+    for i in range(leaves):
+        message.body.add(f"_data.f{i}", DFUInt16(value=i))
+    message.body.payload = DFBuffer(value=bytes(payload))
+    return message
+
+
+async def monitor(stop: asyncio.Event) -> float:
+    """Longest delay past a 1 ms sleep, in seconds"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst = max(worst, time.perf_counter() - start - 0.001)
+    return worst
+
+
+async def connection(message, count: int, size: int, streaming: bool):
+    left, right = socket.socketpair()
+    reader, reader_writer = await asyncio.open_connection(sock=right)
+    _, writer = await asyncio.open_connection(sock=left)
+
+    async def send():
+        for _ in range(count):
+            if streaming:
+                await message.write_to(writer)
+            else:
+                writer.write(message.pack())
+                await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+    async def receive():
+        received = 0
+        while True:
+            data = await reader.read(1 << 20)
+            if not data:
+                break
+            received += len(data)
+        return received
+
+    _, received = await asyncio.gather(send(), receive())
+    reader_writer.close()
+    await reader_writer.wait_closed()
+    assert received == count * size
+
+
+async def run(args, streaming: bool):
+    message = build(args.leaves, args.payload)
+    size = message.nbytes
+    stop = asyncio.Event()
+    stall = asyncio.create_task(monitor(stop))
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            connection(message, args.messages, size, streaming)
+            for _ in range(args.connections)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    stop.set()
+    total = args.connections * args.messages
+    return total / elapsed, total * size / elapsed / 1e6, await stall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--leaves", type=int, default=5000)
+    parser.add_argument("--payload", type=int, default=1 << 20)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'msgs/s':>10} {'MB/s':>10} {'max stall ms':>14}")
+    for name, streaming in [("pack", False), ("write_to", True)]:
+        rate, throughput, stall = asyncio.run(run(args, streaming))
+        print(f"{name:<10} {rate:>10.1f} {throughput:>10.1f} {stall * 1e3:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Attribute access microbenchmark
+
+Reports the cost of one attribute access on containers: internal
+attributes and methods used while packing, child and grandchild access,
+DFLength children and the __setattr__ auto-add path.
+
+    python -m benchmarks.bench_attribute_access [--number N]
+"""
+import argparse
+import timeit
+
+from dataforge import DFContainer, DFLength, DFUInt8, DFUInt16
+
+
+def build() -> DFContainer:
+    container = DFContainer()
+    for i in range(32):
+        container.add(f"f{i}", DFUInt8(value=i))
+    container.sub = DFContainer()
+    container.sub.inner = DFContainer()
+    container.sub.inner.leaf = DFUInt16()
+    container.body = DFLength(DFUInt16(), DFContainer())
+    container.body.leaf = DFUInt8()
+    return container
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200_000)
+    args = parser.parse_args()
+
+    cases = [
+        ("internal attribute", "c._parent"),
+        ("method lookup", "c.pack"),
+        ("child", "c.f31"),
+        ("grandchild", "c.sub.inner.leaf"),
+        ("DFLength internal", "c.body._field"),
+        ("DFLength child", "c.body.leaf"),
+        ("setattr auto-add", "c.sub.inner.leaf = leaf"),
+    ]
+    namespace = {"c": build(), "leaf": DFUInt16()}
+    print(f"{'access':<20} {'ns/op':>8}")
+    for name, stmt in cases:
+        best = min(timeit.repeat(stmt, globals=namespace, number=args.number))
+        print(f"{name:<20} {best / args.number * 1e9:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Memory footprint benchmark
+
+Uses tracemalloc to report the bytes held per scalar field, per buffer
+field and per container (with the children it holds).
+
+    python -m benchmarks.bench_memory [--count N]
+"""
+import argparse
+import tracemalloc
+
+from dataforge import DFBuffer, DFContainer, DFUInt8, DFUInt16, DFUInt32
+
+
+def measure(factory, count: int) -> float:
+    """Average traced bytes per object built by factory"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # The list itself costs one pointer per object
+    size = after - before - objects.__sizeof__()
+    del objects
+    return size / count
+
+
+def container(i: int) -> DFContainer:
+    obj = DFContainer()
+    obj.flags = DFUInt8(value=i)
+    obj.seq = DFUInt16(value=i)
+    obj.addr = DFUInt32(value=i)
+    return obj
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    cases = [
+        ("DFUInt8", lambda i: DFUInt8(value=i)),
+        ("DFUInt16", lambda i: DFUInt16(value=i)),
+        ("DFUInt32", lambda i: DFUInt32(value=i)),
+        ("DFBuffer", lambda i: DFBuffer(value=b"")),
+        ("DFContainer (3 fields)", container),
+    ]
+    print(f"{'type':<24} {'bytes/object':>12}")
+    for name, factory in cases:
+        print(f"{name:<24} {measure(factory, args.count):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Pack scaling benchmark
+
+Packs flat containers of 10 to 1,000,000 leaves and reports the time per
+leaf, which should stay flat as the container grows.
+
+    python -m benchmarks.bench_pack_scaling [--max-leaves N] [--repeat N]
+"""
+import argparse
+import time
+
+from dataforge import DFContainer, DFLength, DFUInt16, DFUInt32
+
+
+def build(leaves: int) -> DFContainer:
+    container = DFContainer()
+    container.payload = DFLength(DFUInt32(), DFContainer())
+    data = container.payload._children["_data"]
+    for i in range(leaves):
+        data.add(f"f{i}", DFUInt16(value=i))
+    return container
+
+
+def measure(container: DFContainer, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        container.pack()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-leaves", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'leaves':>10} {'seconds':>12} {'ns/leaf':>10}")
+    leaves = 10
+    while leaves <= args.max_leaves:
+        elapsed = measure(build(leaves), args.repeat)
+        print(f"{leaves:>10} {elapsed:>12.6f} {elapsed / leaves * 1e9:>10.1f}")
+        leaves *= 10
+
+
+if __name__ == "__main__":
+    main()
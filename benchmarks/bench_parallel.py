@@ -0,0 +1,64 @@
+"""Multi-process packing benchmark
+
+Packs records with a variable-size payload in this process and with
+pack_parallel across a growing number of worker processes, reporting
+records per second.
+
+    python -m benchmarks.bench_parallel [--count N] [--workers N]
+"""
+import argparse
+import os
+import time
+
+from dataforge import (
+    DFBuffer,
+    DFContainer,
+    DFLength,
+    DFUInt8,
+    DFUInt16,
+    DFUInt32,
+    pack_parallel,
+)
+
+
+def build() -> DFContainer:
+    record = DFContainer()
+    record.seq = DFUInt32()
+    record.body = DFLength(DFUInt16(), DFContainer())
+    for i in range(16):
+        record.body.add(f"_data.f{i}", DFUInt16())
+    record.body.flags = DFUInt8()
+    record.body.payload = DFBuffer()
+    return record
+
+
+def rows(count: int):
+    for i in range(count):
+        yield (i,) + (i & 0xFFFF,) * 16 + (i & 0xFF, bytes(i % 64))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=500_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    plan = build().compile()
+    start = time.perf_counter()
+    serial = b"".join(plan.pack(row) for row in rows(args.count))
+    elapsed = time.perf_counter() - start
+    print(f"{'workers':<10} {'records/s':>12}")
+    print(f"{'serial':<10} {args.count / elapsed:>12.0f}")
+
+    workers = 1
+    while workers <= args.workers:
+        start = time.perf_counter()
+        buf, _ = pack_parallel(build(), rows(args.count), workers=workers)
+        elapsed = time.perf_counter() - start
+        assert buf == serial
+        print(f"{workers:<10} {args.count / elapsed:>12.0f}")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Schema cache benchmark
+
+Builds a schema of many groups, each a length reference and a length
+counted block of fields, with add() calls, and compares that with
+loading the same schema from a file written by save_schema.
+
+    python -m benchmarks.bench_schema_cache [--groups N] [--fields N]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from dataforge import (
+    DFContainer,
+    DFLength,
+    DFLengthRef,
+    DFUInt8,
+    DFUInt16,
+    load_schema,
+    save_schema,
+)
+
+
+def build(groups: int, fields: int) -> DFContainer:
+    schema = DFContainer()
+    for i in range(groups):
+        schema.add(f"g{i}", DFContainer())
+        schema.add(f"g{i}.len", DFLengthRef(DFUInt16(), f"g{i}.body"))
+        schema.add(f"g{i}.body", DFLength(DFUInt16(), DFContainer()))
+        for j in range(fields):
+            schema.add(f"g{i}.body._data.f{j}", DFUInt8(value=j & 0xFF))
+    return schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--fields", type=int, default=100)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    schema = build(args.groups, args.fields)
+    built = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "schema.dfschema")
+        save_schema(schema, path)
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        loaded = load_schema(path)
+        elapsed = time.perf_counter() - start
+    assert loaded.pack() == schema.pack()
+
+    print(f"{'mode':<10} {'ms':>10}")
+    print(f"{'add()':<10} {built * 1e3:>10.1f}")
+    print(f"{'load':<10} {elapsed * 1e3:>10.1f}")
+    print(f"file size {size / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
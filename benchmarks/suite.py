@@ -0,0 +1,209 @@
+"""Benchmark suite
+
+Times a fixed set of cases and reports operations per second, time per
+node and peak traced memory. Results can be saved as JSON and compared
+against an earlier run, failing when any case is slower or uses more
+memory than the baseline by more than the threshold.
+
+    python -m benchmarks.suite [--scale X] [--repeat N] [--case NAME]
+        [--json FILE] [--baseline FILE] [--threshold FRACTION]
+"""
+import argparse
+import json
+import platform
+import sys
+import timeit
+import tracemalloc
+
+from dataforge import (
+    DFBuffer,
+    DFCallableRef,
+    DFContainer,
+    DFLength,
+    DFLengthRef,
+    DFUInt8,
+    DFUInt16,
+    DFUInt32,
+)
+
+
+def checksum(data: bytes) -> int:
+    return sum(data) & 0xFFFF
+
+
+def wide_pack(scale: float):
+    leaves = int(10_000 * scale)
+    container = DFContainer()
+    for i in range(leaves):
+        container.add(f"f{i}", DFUInt16(value=i))
+    return container.pack, leaves
+
+
+def deep_containers_pack(scale: float):
+    depth = int(200 * scale)
+    container = DFContainer()
+    node = container
+    for _ in range(depth):
+        node.leaf = DFUInt8(value=1)
+        node.sub = DFContainer()
+        node = node.sub
+    return container.pack, 2 * depth
+
+
+def deep_lengths_pack(scale: float):
+    depth = int(200 * scale)
+    container = DFContainer()
+    node = container
+    for _ in range(depth):
+        node.leaf = DFUInt8(value=1)
+        node.sub = DFLength(DFUInt16(), DFContainer())
+        node = node.sub
+    return container.pack, 2 * depth
+
+
+def shared_refs_pack(scale: float):
+    refs = int(100 * scale)
+    leaves = int(5_000 * scale)
+    container = DFContainer()
+    for i in range(refs):
+        container.add(f"len{i}", DFLengthRef(DFUInt32(), "shared"))
+        container.add(f"sum{i}", DFCallableRef(DFUInt16(), checksum, "shared"))
+    container.shared = DFContainer()
+    for i in range(leaves):
+        container.shared.add(f"f{i}", DFUInt8(value=i & 0xFF))
+    return container.pack, 2 * refs + leaves
+
+
+def large_buffer_pack(scale: float):
+    size = int((16 << 20) * scale)
+    container = DFContainer()
+    container.body = DFLength(DFUInt32(), DFContainer())
+    container.body.head = DFUInt16(value=1)
+    container.body.payload = DFBuffer(value=bytes(size))
+    return container.pack, 3
+
+
+def dotted_add(scale: float):
+    groups = int(100 * scale)
+
+    def build():
+        container = DFContainer()
+        for i in range(groups):
+            container.add(f"g{i}", DFContainer())
+            for j in range(100):
+                container.add(f"g{i}.f{j}", DFUInt8(value=j))
+        return container
+
+    return build, 101 * groups
+
+
+def pretty_print(scale: float):
+    leaves = int(2_000 * scale)
+    container = DFContainer()
+    container.body = DFLength(DFUInt16(), DFContainer())
+    for i in range(leaves):
+        container.body.add(f"_data.f{i}", DFUInt16(value=i))
+    container.body.payload = DFBuffer(value=bytes(64))
+    return container.pretty_print, leaves + 2
+
+
+CASES = {
+    "wide_pack": wide_pack,
+    "deep_containers_pack": deep_containers_pack,
+    "deep_lengths_pack": deep_lengths_pack,
+    "shared_refs_pack": shared_refs_pack,
+    "large_buffer_pack": large_buffer_pack,
+    "dotted_add": dotted_add,
+    "pretty_print": pretty_print,
+}
+
+
+def run_case(factory, scale: float, repeat: int) -> dict:
+    """Best time per call over repeat rounds and peak memory of one call"""
+    func, nodes = factory(scale)
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "ops_per_sec": 1 / best,
+        "ns_per_node": best / nodes * 1e9,
+        "peak_bytes": peak,
+        "nodes": nodes,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Returns a description of every case worse than baseline"""
+    regressions = []
+    for name, result in results["cases"].items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            continue
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            change = result["ops_per_sec"] / base["ops_per_sec"] - 1
+            regressions.append(f"{name}: ops/sec {change:+.1%}")
+        if result["peak_bytes"] > base["peak_bytes"] * (1 + threshold):
+            change = result["peak_bytes"] / base["peak_bytes"] - 1
+            regressions.append(f"{name}: peak memory {change:+.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--case", action="append", choices=sorted(CASES))
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Compare against this results file")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline["scale"] != args.scale:
+            parser.error(f"Baseline was run with --scale {baseline['scale']}")
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": args.scale,
+        "cases": {},
+    }
+    print(
+        f"{'case':<22} {'ops/sec':>12} {'ns/node':>10}"
+        f" {'peak KiB':>10} {'vs base':>8}"
+    )
+    for name in args.case or CASES:
+        result = run_case(CASES[name], args.scale, args.repeat)
+        results["cases"][name] = result
+        change = ""
+        if baseline and name in baseline["cases"]:
+            ratio = result["ops_per_sec"] / baseline["cases"][name]["ops_per_sec"]
+            change = f"{ratio - 1:+.1%}"
+        print(
+            f"{name:<22} {result['ops_per_sec']:>12.1f}"
+            f" {result['ns_per_node']:>10.1f}"
+            f" {result['peak_bytes'] / 1024:>10.1f} {change:>8}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 """DataForge Module imports"""
+from .batch import iter_pack_batch, pack_batch
+from .cache import cached_schema, load_schema, save_schema, schema_key
 from .dataforge import (
+    DFArray,
     DFBuffer,
     DFCallableRef,
     DFContainer,
+    DFCountRef,
     DFEndian,
+    DFFileBuffer,
     DFLength,
     DFLengthRef,
     DFSInt8,
@@ -13,18 +18,45 @@ from .dataforge import (
     DFUInt16,
     DFUInt32,
 )
+from .digest import DFDigestRef
+from .parallel import iter_pack_parallel, pack_parallel, pack_parallel_to
+from .plan import DFPackPlan
+from .profiler import DFProfiler
+from .stream import aiter_unpack, iter_unpack
+from .structs import DFStruct
+from .view import DFFrozen, DFView
 
 __all__ = [
+    "DFArray",
     "DFBuffer",
     "DFContainer",
+    "DFCountRef",
     "DFEndian",
+    "DFFileBuffer",
+    "DFFrozen",
     "DFLength",
     "DFLengthRef",
     "DFCallableRef",
+    "DFDigestRef",
+    "DFPackPlan",
+    "DFProfiler",
     "DFSInt8",
     "DFSInt16",
     "DFSInt32",
+    "DFStruct",
     "DFUInt8",
     "DFUInt16",
     "DFUInt32",
+    "DFView",
+    "aiter_unpack",
+    "cached_schema",
+    "iter_pack_batch",
+    "iter_pack_parallel",
+    "iter_unpack",
+    "load_schema",
+    "pack_batch",
+    "pack_parallel",
+    "pack_parallel_to",
+    "save_schema",
+    "schema_key",
 ]
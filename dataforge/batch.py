@@ -0,0 +1,116 @@
+"""DataForge columnar batch packing
+"""
+import array
+import itertools
+import struct
+
+from .exceptions import DFRangeException, DFTypeException
+from .plan import DFPackPlan
+
+# Records packed per struct call for fixed-width layouts
+_BLOCK = 1024
+
+
+def _plan_for(schema) -> DFPackPlan:
+    if isinstance(schema, DFPackPlan):
+        return schema
+    return schema.compile()
+
+
+def _rows(plan, columns, count):
+    """Returns the record count and an iterator of value tuples
+
+    Leaves without a column repeat their compiled value.
+    """
+    unknown = set(columns) - set(plan.fields)
+    if unknown:
+        raise DFTypeException(f"No leaf fields named {sorted(unknown)}")
+    lengths = {len(column) for column in columns.values()}
+    if count is not None:
+        lengths.add(count)
+    if len(lengths) != 1:
+        raise DFRangeException("Columns and count must all have the same length")
+    count = lengths.pop()
+
+    ordered = []
+    for field, default in zip(plan.fields, plan.defaults):
+        if field in columns:
+            ordered.append(columns[field])
+        else:
+            ordered.append(itertools.repeat(default, count))
+    return count, zip(*ordered)
+
+
+def _pack_fixed(plan, count, rows):
+    """Packs fixed-width records, a block of records per struct call"""
+    packer = plan._single
+    fields = len(plan.fields)
+    prefix = packer.format[0]
+    body = packer.format[1:]
+    buf = bytearray(packer.size * count)
+    flat = itertools.chain.from_iterable(map(plan._checked, rows))
+
+    offset = 0
+    while count:
+        block = min(count, _BLOCK)
+        bulk = struct.Struct(prefix + body * block)
+        values = tuple(itertools.islice(flat, block * fields))
+        try:
+            bulk.pack_into(buf, offset, *values)
+        except struct.error:
+            normalized = []
+            for start in range(0, len(values), fields):
+                normalized.extend(plan._normalize(values[start : start + fields]))
+            bulk.pack_into(buf, offset, *normalized)
+        offset += bulk.size
+        count -= block
+    return buf
+
+
+def pack_batch(schema, columns, count=None):
+    """Packs one record per row of a set of columns
+
+    Args:
+        schema: DFContainer or DFPackPlan describing one record
+        columns (dict): Leaf path, as in DFPackPlan.fields, to a sequence
+            of values such as a list, array.array or NumPy array
+        count (int): Number of records, needed when no columns are given
+
+    Returns:
+        tuple: bytearray holding the records back to back, and an
+        array.array of count + 1 offsets where record i is
+        buf[offsets[i]:offsets[i + 1]]
+    """
+    plan = _plan_for(schema)
+    count, rows = _rows(plan, columns, count)
+    return _pack_rows(plan, count, rows)
+
+
+def _pack_rows(plan, count, rows):
+    """Packs count value tuples back to back, as returned by pack_batch"""
+    if plan._single is not None:
+        size = plan._single.size
+        offsets = array.array("Q", range(0, size * (count + 1), size))
+        return _pack_fixed(plan, count, rows), offsets
+
+    rows = list(rows)
+    offsets = array.array("Q", [0])
+    total = 0
+    for row in rows:
+        total += plan.nbytes(row)
+        offsets.append(total)
+    buf = bytearray(total)
+    for offset, row in zip(offsets, rows):
+        plan.pack_into(buf, offset, row)
+    return buf, offsets
+
+
+def iter_pack_batch(schema, columns, count=None):
+    """Yields the packed bytes of one record per row of a set of columns
+
+    Takes the same arguments as pack_batch.
+    """
+    plan = _plan_for(schema)
+    _, rows = _rows(plan, columns, count)
+    for row in rows:
+        yield plan.pack(row)
@@ -0,0 +1,217 @@
+"""DataForge on-disk schema cache
+
+Schemas are stored as pickles, and unpickling runs code chosen by whoever
+wrote the file. load_schema therefore only reads files owned by the
+current user that nobody else can write. That check needs POSIX file
+ownership; elsewhere, keep the cache directory private.
+"""
+import enum
+import hashlib
+import marshal
+import os
+import pickle  # nosec B403 - see the module docstring
+import stat
+import struct
+import sys
+import tempfile
+import types
+
+from .exceptions import DFTypeException
+
+# Magic, file format version and content hash of the schema definition
+_MAGIC = b"DFSC"
+_FORMAT = 1
+_HEADER = struct.Struct("<4sH32s")
+
+_SUFFIX = ".dfschema"
+
+# Hash of the library's source, computed on first use
+_LIBRARY_HASH = []
+
+# Values identified by their repr in schema keys
+_PLAIN = (type(None), bool, int, float, complex, str, bytes, enum.Enum)
+
+
+def _library_hash() -> bytes:
+    if not _LIBRARY_HASH:
+        digest = hashlib.sha256()
+        package = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(package)):
+            if name.endswith(".py"):
+                with open(os.path.join(package, name), "rb") as file:
+                    digest.update(file.read())
+        _LIBRARY_HASH.append(digest.digest())
+    return _LIBRARY_HASH[0]
+
+
+def _global_names(code) -> set:
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return names
+
+
+def _hash_function(digest, func, seen):
+    if func in seen:
+        return
+    seen.add(func)
+    digest.update(marshal.dumps(func.__code__))
+    _hash_value(digest, func.__defaults__, seen)
+    _hash_value(digest, func.__kwdefaults__, seen)
+    for cell in func.__closure__ or ():
+        try:
+            _hash_value(digest, cell.cell_contents, seen)
+        except ValueError:
+            # Variable not yet assigned
+            digest.update(b"\0")
+    for name in sorted(_global_names(func.__code__)):
+        if name in func.__globals__:
+            digest.update(name.encode())
+            _hash_value(digest, func.__globals__[name], seen)
+
+
+def _hash_value(digest, value, seen):
+    if isinstance(value, types.FunctionType):
+        _hash_function(digest, value, seen)
+    elif isinstance(value, _PLAIN):
+        digest.update(repr(value).encode())
+    elif isinstance(value, tuple):
+        digest.update(f"tuple{len(value)}".encode())
+        for item in value:
+            _hash_value(digest, item, seen)
+    else:
+        # Only the name: the repr of other objects may hold their address,
+        # and mutable ones change as the program runs
+        name = getattr(value, "__qualname__", type(value).__qualname__)
+        module = getattr(value, "__module__", type(value).__module__)
+        digest.update(f"{module}.{name}".encode())
+
+
+def _check_owner(path, status):
+    if not hasattr(os, "getuid"):
+        return
+    if status.st_uid != os.getuid() or status.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise DFTypeException(f"{path} is writable by another user")
+
+
+def schema_key(build, extra=b"") -> bytes:
+    """Content hash of the function that builds a schema
+
+    Covers the code of build, including functions defined inside it, its
+    default arguments, the variables it closes over and the globals it
+    reads, along with the Python version and the library a cached schema
+    is loaded into. Functions among those values are covered the same way.
+    Numbers, strings, bytes, enums and tuples of them are covered by value;
+    other objects, lists and dicts among them, only by their name, so mix
+    their state into extra.
+
+    Args:
+        build: Function that returns the schema
+        extra (bytes): Anything else the schema depends on
+
+    Returns:
+        bytes: 32-byte SHA-256 digest
+    """
+    if isinstance(extra, str):
+        extra = extra.encode()
+    digest = hashlib.sha256()
+    digest.update(_MAGIC + _FORMAT.to_bytes(2, "little"))
+    digest.update(sys.version.encode())
+    digest.update(_library_hash())
+    _hash_function(digest, build, set())
+    digest.update(extra)
+    return digest.digest()
+
+
+def save_schema(schema, path, key=None):
+    """Writes a schema to a versioned file, replacing it atomically
+
+    Args:
+        schema: DFContainer or DFPackPlan, which must pickle, along with
+            any callables its references use
+        path: File to write
+        key (bytes): Content hash stored with the schema, see schema_key
+    """
+    data = _HEADER.pack(_MAGIC, _FORMAT, key or bytes(32))
+    data += pickle.dumps(schema, pickle.HIGHEST_PROTOCOL)
+    fileno, temp = tempfile.mkstemp(
+        suffix=".tmp", dir=os.path.dirname(os.path.abspath(path))
+    )
+    try:
+        with os.fdopen(fileno, "wb") as file:
+            file.write(data)
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def load_schema(path, key=None):
+    """Reads a schema written by save_schema
+
+    Unpickling runs code chosen by whoever wrote the file, so on POSIX the
+    file must belong to the current user and be writable by nobody else.
+
+    Args:
+        path: File to read
+        key (bytes): Expected content hash, not checked when None
+
+    Returns:
+        The DFContainer or DFPackPlan, ready to pack
+    """
+    with open(path, "rb") as file:
+        _check_owner(path, os.fstat(file.fileno()))
+        data = file.read()
+    if len(data) < _HEADER.size:
+        raise DFTypeException(f"{path} is not a schema file")
+    magic, version, stored = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise DFTypeException(f"{path} is not a schema file")
+    if version != _FORMAT:
+        raise DFTypeException(f"{path} has schema format {version}, not {_FORMAT}")
+    if key is not None and stored != key:
+        raise DFTypeException(f"{path} holds a stale schema")
+    # Written by this user, see _check_owner
+    return pickle.loads(memoryview(data)[_HEADER.size :])  # nosec B301
+
+
+def cached_schema(build, cache_dir, extra=b""):
+    """Returns the schema build makes, loading it from cache_dir if current
+
+    The schema is cached in a file named after build and keyed by
+    schema_key, so a cached schema is rebuilt once build, the node
+    library or the Python version change. Unreadable entries, and entries
+    another user could have written, are rebuilt too. Loading skips every
+    add() call of build.
+
+    Args:
+        build: Function that returns a DFContainer or DFPackPlan
+        cache_dir: Directory of the cache files, created when missing
+        extra (bytes): Anything else the schema depends on, see schema_key
+
+    Returns:
+        A schema equal to build(), but not shared with other callers
+    """
+    key = schema_key(build, extra)
+    name = f"{build.__module__}.{build.__qualname__}".replace("<locals>", "locals")
+    path = os.path.join(cache_dir, name + _SUFFIX)
+    try:
+        return load_schema(path, key)
+    except (
+        OSError,
+        EOFError,
+        AttributeError,
+        ImportError,
+        IndexError,
+        KeyError,
+        ValueError,
+        DFTypeException,
+        pickle.UnpicklingError,
+    ):
+        pass
+
+    schema = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    save_schema(schema, path, key)
+    return schema
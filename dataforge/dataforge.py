@@ -1,238 +1,96 @@
 """DataForge package
 """
 
-import abc
-import binascii
+import copy
+import functools
+import io
 import logging
-import struct
 from collections import OrderedDict
-from enum import Enum
 
-from .exceptions import DFEndianException, DFRangeException, DFTypeException
-
-
-class DFEndian(Enum):
-    """DFEndian
-
-    Args:
-        Enum (int): Endian
+from .datatypes import (
+    DFArray,
+    DFBasicDataType,
+    DFBuffer,
+    DFEndian,
+    DFFileBuffer,
+    DFSInt8,
+    DFSInt16,
+    DFSInt32,
+    DFUInt8,
+    DFUInt16,
+    DFUInt32,
+    _read_field,
+    _UnpackContext,
+)
+from .exceptions import DFRangeException, DFTypeException
+
+# Leaf types are defined in datatypes and still importable from here
+__all__ = [
+    "DFArray",
+    "DFBasicDataType",
+    "DFBuffer",
+    "DFCallableRef",
+    "DFContainer",
+    "DFCountRef",
+    "DFEndian",
+    "DFFileBuffer",
+    "DFLength",
+    "DFLengthRef",
+    "DFSInt8",
+    "DFSInt16",
+    "DFSInt32",
+    "DFUInt8",
+    "DFUInt16",
+    "DFUInt32",
+]
+
+_logger = logging.getLogger(__name__)
+
+# Last structure version handed out. The root of a tree takes a new one
+# whenever the tree changes shape; resolved references, path indexes and
+# reference graphs in that tree are rebuilt once it moves on
+_STRUCTURE_VERSION = [0]
+
+
+def _structure_changed(node):
+    """Gives the tree holding node a new structure version"""
+    _STRUCTURE_VERSION[0] += 1
+    while node._parent is not None:
+        node = node._parent
+    node._version = _STRUCTURE_VERSION[0]
+
+
+def _structure_version(node) -> int:
+    """Returns the structure version of the tree holding node"""
+    while node._parent is not None:
+        node = node._parent
+    return node._version
+
+
+# Container properties read on every node while packing, which no child
+# can take the name of
+_RESERVED_NAMES = frozenset(("nbytes",))
+
+
+def _child_first(getter):
+    """Makes a container property return the child of the same name, if any
+
+    Properties are found before the instance __dict__ that children are
+    stored in, so such a child could not be reached as an attribute
+    otherwise.
     """
+    name = getter.__name__
 
-    LITTLE = 1
-    BIG = 2
-
-
-class DFBasicDataType(abc.ABC):
-    """DFBasicDataType
-
-    Abstract base class for all data types
-    """
-
-    def __init__(self):
-        pass
-
-    @property
-    def value(self):
-        pass
-
-    @value.setter
-    def value(self, value):
-        pass
-
-    @abc.abstractmethod
-    def pack(self):
-        pass
-
-    @property
-    def length(self):
-        pass
-
-
-class DFUInt8(DFBasicDataType):
-    """Unsigned int 8-bit"""
-
-    def __init__(self, value=0):
-        self._fmt = "B"
-        self._width = 1
-        self.value = value
-
-    @property
-    def value(self):
-        return self._value
-
-    @value.setter
-    def value(self, val):
-        if isinstance(val, int):
-            self._value = val & 0xFF
-        elif isinstance(val, bytes):
-            if len(val) > 1:
-                raise DFRangeException
-            self._value = ord(val)
-        else:
-            raise DFTypeException
-
-    def pack(self):
-        return struct.pack(self._fmt, self._value)
-
-    @property
-    def length(self):
-        return self._width
-
-    def __str__(self):
-        return self.pretty_print()
-
-    def pretty_print(self, indent=0):
-        return " " * indent + "|- " + f"Unsigned Byte 0x{self.value:02X}"
-
-
-class DFSInt8(DFUInt8):
-    """Signed int 8-bit"""
-
-    def __init__(self, **kwargs):
-        self._fmt = "b"
-        super().__init__(**kwargs)
-
-    def pretty_print(self, indent=0):
-        return " " * indent + "|- " + f"Signed Byte 0x{self.value:02X}"
-
-
-class DFUInt16(DFBasicDataType):
-    """Unsigned int 16-bit"""
-
-    def __init__(self, value=0, endian=DFEndian.LITTLE):
-        if endian == DFEndian.LITTLE:
-            self._endian = "<"
-        elif endian == DFEndian.BIG:
-            self._endian = ">"
-        else:
-            raise DFEndianException
-        self._fmt = "H"
-        self._width = 2
-        self.value = value
-
-    @property
-    def value(self):
-        return self._value
-
-    @value.setter
-    def value(self, val):
-        if isinstance(val, int):
-            self._value = val & 0xFFFF
-        else:
-            if len(val) > 2:
-                raise DFRangeException
-            self._value = struct.unpack("@" + self._fmt, val)[0]
-
-    def pack(self):
-        return struct.pack(self._endian + self._fmt, self.value)
-
-    @property
-    def length(self):
-        return self._width
-
-    def __str__(self):
-        return self.pretty_print()
-
-    def pretty_print(self, indent=0):
-        return " " * indent + "|- " + f"Unsigned Short 0x{self.value:04X}"
-
-
-class DFSInt16(DFUInt16):
-    """docstring for DFSInt16"""
-
-    def __init__(self, **kwargs):
-        self._fmt = "h"
-        super().__init__(**kwargs)
-
-    def pretty_print(self, indent=0):
-        return " " * indent + "|- " + f"Signed Short 0x{self.value:04X}"
-
-
-class DFUInt32(DFBasicDataType):
-    """Unsigned int 32-bit"""
-
-    def __init__(self, value=0, endian=DFEndian.LITTLE):
-        if endian == DFEndian.LITTLE:
-            self._endian = "<"
-        elif endian == DFEndian.BIG:
-            self._endian = ">"
-        else:
-            raise DFEndianException
-        self._fmt = "I"
-        self._width = 4
-        self.value = value
-
-    @property
-    def value(self):
-        return self._value
-
-    @value.setter
-    def value(self, val):
-        if isinstance(val, int):
-            self._value = val & 0xFFFFFFFF
-        else:
-            if len(val) > 4:
-                raise DFRangeException
-            self._value = struct.unpack("@" + self._fmt, val)[0]
-
-    def pack(self):
-        return struct.pack(self._endian + self._fmt, self.value)
-
-    @property
-    def length(self):
-        return self._width
-
-    def __str__(self):
-        return self.pretty_print()
-
-    def pretty_print(self, indent=0):
-        return " " * indent + "|- " + f"Unsigned Long 0x{self.value:08X}"
-
-
-class DFSInt32(DFUInt32):
-    """docstring for DFSInt32"""
-
-    def __init__(self, **kwargs):
-        self._fmt = "i"
-        super().__init__(**kwargs)
-
-    def pretty_print(self, indent=0):
-        return " " * indent + "|- " + f"Signed Long 0x{self.value:08X}"
-
-
-class DFBuffer(DFBasicDataType):
-    """Buffer data type"""
-
-    def __init__(self, value=b""):
-        self._value = value
-        self._width = len(self._value)
+    @functools.wraps(getter)
+    def get(self):
+        child = self.__dict__.get(name)
+        if child is None:
+            return getter(self)
+        return child
 
-    @property
-    def length(self):
-        return self._width
+    return get
 
-    def pack(self):
-        return self.value
 
-    @property
-    def value(self):
-        return self._value
-
-    @value.setter
-    def value(self, val):
-        if isinstance(val, bytes):
-            self._value = val
-        else:
-            raise DFTypeException("DFBuffer must be type: bytes")
-
-    def pretty_print(self, indent=0):
-        short_val = str(binascii.hexlify(self.pack()))
-        if self.length > 10:
-            short_val = str(binascii.hexlify(self.pack()[:10])) + "..."
-        return " " * indent + "|- " + f"Buffer {short_val}"
-
-
-# is a container a basic data type or its own thing?
 class DFContainer(DFBasicDataType):
     """docstring for DFContainer"""
 
@@ -240,8 +98,17 @@ class DFContainer(DFBasicDataType):
         self._children = OrderedDict()
         self._name = None
         self._parent = None
+        self._incremental = False
+        self._cache = None
+        self._dependents = None
+        # Structure version of the tree, kept up to date on its root
+        self._version = 0
+        # (structure version, path -> node) and (structure version, ids)
+        self._index = None
+        self._ref_targets = None
 
     @property
+    @_child_first
     def name(self):
         return self._name
 
@@ -250,73 +117,349 @@ class DFContainer(DFBasicDataType):
         self._name = name
 
     @property
+    @_child_first
     def parent(self):
         return self._parent
 
     @parent.setter
     def parent(self, parent):
+        if self._parent is not None:
+            _structure_changed(self._parent)
         self._parent = parent
+        _structure_changed(self)
 
     def add(self, name, obj):
+        if name.rsplit(".", 1)[-1] in _RESERVED_NAMES:
+            raise DFTypeException(f"{name} is a container property, not a child")
         root = name
+        if getattr(obj, "_parent", None) is not None:
+            _structure_changed(obj._parent)
         obj._parent = self
+        _structure_changed(self)
         sub_container = None
-        logging.debug(name)
+        _logger.debug(name)
         if "." in root:
             root, sub_container = root.split(".", 1)
-        logging.debug("%s : %s", root, sub_container)
-        logging.debug("Adding %s to %s (sub: %s)", type(obj), root, sub_container)
+        _logger.debug("%s : %s", root, sub_container)
+        _logger.debug("Adding %s to %s (sub: %s)", type(obj), root, sub_container)
         if root is not None and sub_container is None and isinstance(obj, DFContainer):
-            logging.debug("SETTING NAME!!! %s", sub_container)
-            obj.name = root
-        if root in iter(self._children) and sub_container is not None:
+            _logger.debug("SETTING NAME!!! %s", sub_container)
+            obj._name = root
+        if sub_container is not None and root in self._children:
             # Recurse
-            logging.debug("%s in children for this container", root)
+            _logger.debug("%s in children for this container", root)
             self._children[root].add(sub_container, obj)
         else:
-            logging.debug("New child, Setting %s to %s", root, obj)
+            _logger.debug("New child, Setting %s to %s", root, obj)
             self._children[root] = obj
+            if not root.startswith("_"):
+                # Plain attribute lookup then finds the child directly
+                self.__dict__[root] = obj
+            if self._incremental:
+                if isinstance(obj, DFContainer):
+                    obj._set_incremental(True)
+                self._invalidate()
 
         return self
 
-    def __getattribute__(self, name):
-        if name != "_children" and name in self._children.keys():
-            return self._children[name]
-
-        return super().__getattribute__(name)
+    def __getattr__(self, name):
+        # Only reached when normal lookup fails, so internal attributes and
+        # methods cost nothing extra
+        try:
+            return self.__dict__["_children"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getstate__(self):
+        # Lookup caches hold ids and structure versions of this process
+        state = self.__dict__.copy()
+        for name in ("_index", "_ref_targets", "_resolved"):
+            if name in state:
+                state[name] = None
+        return state
 
     def __setattr__(self, name, obj):
         if isinstance(obj, DFBasicDataType) and not name.startswith(
             "_"
         ):  # Or whatever a container is?
-            logging.debug("SETTER: %s", name)
+            _logger.debug("SETTER: %s", name)
             self.add(name, obj)
-        else:
+        elif not self._set_child_value(name, obj):
             super().__setattr__(name, obj)
 
+    def _set_child_value(self, name, value) -> bool:
+        """Sets the value of the child called name, if there is one
+
+        Plain values assigned to a child's name go to the child, so the
+        attribute keeps referring to it.
+        """
+        child = self.__dict__.get(name)
+        if name.startswith("_") or not isinstance(child, DFBasicDataType):
+            return False
+        child.value = value
+        return True
+
     @property
+    @_child_first
+    def incremental(self) -> bool:
+        """Whether packed bytes are cached and only dirty subtrees repacked"""
+        return self._incremental
+
+    @incremental.setter
+    def incremental(self, enabled):
+        self._set_incremental(enabled)
+
+    def _set_incremental(self, enabled):
+        self._incremental = enabled
+        self._cache = None
+        self._dependents = None
+        # References register as dependents when they next resolve
+        _structure_changed(self)
+        for child in self._children.values():
+            if isinstance(child, DFContainer):
+                child._set_incremental(enabled)
+        if self._parent is not None:
+            self._parent._invalidate()
+
+    def _invalidate(self):
+        """Drops cached bytes of this node, its ancestors and their dependents"""
+        node = self
+        while node is not None:
+            node._cache = None
+            for dependent in node._dependents or ():
+                if dependent._cache is not None:
+                    dependent._invalidate()
+            node = node._parent
+
+    @property
+    @_child_first
     def length(self):
-        return len(repr(self))
+        return self.nbytes
+
+    @property
+    def nbytes(self) -> int:
+        if self._cache is not None:
+            return len(self._cache)
+        return sum(child.nbytes for child in self._children.values())
 
     # Does value make sense? Does this show we need another basic class type?
-    # @property
-    # def value(self, value):
-    #     pass
+    @property
+    @_child_first
+    def value(self):
+        return None
+
+    @value.setter
+    def value(self, value):
+        pass
 
     def _get_children(self):
         """Returns a copy of its children"""
         return list(iter(self._children.values()))[:]
 
-    def pack(self):
-        data = b""
-        children = self._get_children()
-        while len(children):
-            child = children.pop()
-            if isinstance(child, DFBasicDataType):
-                data = child.pack() + data
+    def _lookup(self, path):
+        """Returns the node at a dotted path below this one
+
+        Resolved paths are kept in an index on this node until the
+        structure of its tree changes.
+        """
+        version = _structure_version(self)
+        if self._index is None or self._index[0] != version:
+            self._index = (version, {})
+        paths = self._index[1]
+        node = paths.get(path)
+        if node is None:
+            node = self
+            for part in path.split("."):
+                node = node._children[part]
+            paths[path] = node
+        return node
+
+    def _get_ref_targets(self):
+        """ids of the nodes in this tree that references in it point at"""
+        version = _structure_version(self)
+        if self._ref_targets is not None and self._ref_targets[0] == version:
+            return self._ref_targets[1]
+
+        targets = set()
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, (DFLengthRef, DFCallableRef)):
+                target = node._get_children()
+                ancestor = target
+                while ancestor is not None and ancestor is not self:
+                    ancestor = ancestor._parent
+                if ancestor is self:
+                    targets.add(id(target))
+            stack.extend(
+                child
+                for child in node._children.values()
+                if isinstance(child, DFContainer)
+            )
+        self._ref_targets = (version, targets)
+        return targets
+
+    def _fixed_nbytes(self):
+        size = 0
+        for child in self._children.values():
+            child_size = child._fixed_nbytes()
+            if child_size is None:
+                return None
+            size += child_size
+        return size
+
+    def _unpack_from(self, view, offset, end, ctx):
+        start = offset
+        children = list(self._children.values())
+        tail = None
+        for index, child in enumerate(children):
+            size = ctx.bounds.pop(id(child), None)
+            if size is not None:
+                child_end = offset + size
+                if child_end > end:
+                    raise DFRangeException("Referenced length exceeds the data")
+            elif child._fixed_nbytes() is None:
+                # Leave room for the fixed-size siblings that follow
+                if tail is None:
+                    tail = [c._fixed_nbytes() or 0 for c in children]
+                child_end = end - sum(tail[index + 1 :])
+            else:
+                child_end = end
+            offset = child._unpack_from(view, offset, child_end, ctx)
+        if ctx.spans is not None:
+            ctx.spans[id(self)] = (start, offset)
+        elif self._incremental:
+            # Leaves are decoded without their setters, so drop stale caches
+            self._invalidate()
+        return offset
+
+    def view(self, buffer, offset=0) -> "DFView":
+        """Binds this schema to packed data without decoding it
+
+        Offsets of every node are computed once, reading only length
+        fields. Fields are decoded when accessed through the returned view.
+        """
+        # pylint: disable-next=import-outside-toplevel,cyclic-import
+        from .view import DFView
+
+        data = memoryview(buffer).cast("B")
+        spans = {}
+        self._unpack_from(data, offset, len(data), _UnpackContext(spans))
+        return DFView(self, data, spans)
+
+    def freeze(self) -> "DFFrozen":
+        """Returns an immutable, hashable snapshot of this tree
+
+        The tree is packed once and the snapshot reads everything from
+        those bytes, so it can be shared between threads. References to
+        nodes outside this tree are followed while packing.
+        """
+        # pylint: disable-next=import-outside-toplevel,cyclic-import
+        from .view import DFFrozen
+
+        buf, spans = _pack_spans(self)
+        data = bytes(buf)
+        # A private copy of the schema, cut off from the tree above, with
+        # the offsets moved over to its nodes
+        copies = {id(self._parent): None}
+        node = copy.deepcopy(self, copies)
+        spans = {id(copies[key]): span for key, span in spans.items()}
+        return DFFrozen(node, memoryview(data), spans, data)
+
+    def _write_into(self, buf, offset, ctx):
+        """Packs fresh bytes in place, ignoring the cache"""
+        if ctx is None or not ctx.targets:
+            for child in self._children.values():
+                offset = child._pack_into(buf, offset, ctx)
+            return offset
+
+        targets = ctx.targets
+        for child in self._children.values():
+            if id(child) in targets:
+                start = offset
+                offset = child._pack_into(buf, offset, ctx)
+                ctx.spans[id(child)] = (start, offset)
+            else:
+                offset = child._pack_into(buf, offset, ctx)
+        return offset
+
+    def _iter_chunks(self):
+        if self._incremental:
+            yield self._packed()
+            return
+        for child in self._children.values():
+            yield from child._iter_chunks()
+
+    def _pack_to(self, fileobj, ctx):
+        if self._incremental:
+            fileobj.write(self._packed())
+            return
+        targets = ctx.targets
+        for child in self._children.values():
+            if id(child) in targets:
+                start = fileobj.tell()
+                child._pack_to(fileobj, ctx)
+                ctx.spans[id(child)] = (start, fileobj.tell())
             else:
-                data = repr(child) + data
-        return data
+                child._pack_to(fileobj, ctx)
+
+    def _pack_seekable(self, fileobj) -> int:
+        start = fileobj.tell()
+        ctx = _PackContext(self._get_ref_targets())
+        self._pack_to(fileobj, ctx)
+        end = fileobj.tell()
+        if id(self) in ctx.targets:
+            ctx.spans[id(self)] = (start, end)
+        ctx.finish_to(fileobj)
+        fileobj.seek(end)
+        return end - start
+
+    def _pack_fresh(self, buf, offset):
+        """Packs this tree as a top-level pack
+
+        References to branches inside the tree are patched after the pass,
+        so each branch is serialized once.
+        """
+        ctx = _PackContext(self._get_ref_targets())
+        end = self._write_into(buf, offset, ctx)
+        if id(self) in ctx.targets:
+            ctx.spans[id(self)] = (offset, end)
+        ctx.finish(buf)
+        return end
+
+    def _packed(self) -> bytes:
+        """Returns the cached bytes, repacking them if this node is dirty"""
+        if self._cache is None:
+            buf = bytearray(self.nbytes)
+            self._pack_fresh(buf, 0)
+            self._cache = bytes(buf)
+        return self._cache
+
+    def _pack_into(self, buf, offset, ctx):
+        if self._incremental:
+            # pack() returns the cached bytes
+            return super()._pack_into(buf, offset, ctx)
+        return self._write_into(buf, offset, ctx)
+
+    def pack_into(self, buf, offset=0):
+        if self._incremental:
+            return self._pack_into(buf, offset, None)
+        return self._pack_fresh(buf, offset)
+
+    def pack(self):
+        if self._incremental:
+            return self._packed()
+        # Every child writes once into a single pre-sized buffer
+        buf = bytearray(self.nbytes)
+        self._pack_fresh(buf, 0)
+        return bytes(buf)
+
+    def compile(self) -> "DFPackPlan":
+        """Flattens this tree into a precompiled, reusable pack plan"""
+        # pylint: disable-next=import-outside-toplevel,cyclic-import
+        from .plan import DFPackPlan
+
+        return DFPackPlan(self)
 
     # def __str__( self ):
     #    return binascii.hexlify( repr( self ) )
@@ -325,19 +468,64 @@ class DFContainer(DFBasicDataType):
         return self.pretty_print()
 
     def pretty_print(self, indent=0):
-        ret = " " * indent + f"+{self.name}\n"
-        for child in self._children:
-            logging.debug("current child: %s (%s)", child, indent)
-            if isinstance(self._children[child], DFContainer):
-                ret += "|" + self._children[child].pretty_print(indent + 1)
+        stream = io.StringIO()
+        self.write_pretty(stream, indent=indent)
+        return stream.getvalue()
+
+    def write_pretty(self, stream, offsets=False, indent=0):
+        """Writes the pretty_print text of this tree to a text stream
+
+        The tree is packed once and lines are written as they are made,
+        so printing is linear in the size of the tree.
+
+        Args:
+            stream: Text stream to write to
+            offsets (bool): Start each line with the offset and length of
+                its node in the packed bytes
+            indent (int): Indent of the first line
+        """
+        # pylint: disable-next=import-outside-toplevel,cyclic-import
+        from .printer import _Printer
+
+        self._write_pretty(_Printer(self, stream, offsets=offsets), indent, "")
+
+    def write_hexdump(self, stream, width=16, limit=None):
+        """Writes a hexdump of the packed tree, annotated with field paths
+
+        Every field starts a new row labelled with its dotted path, so
+        each byte range maps back to the field that produced it.
+
+        Args:
+            stream: Text stream to write to
+            width (int): Bytes per row
+            limit (int): Bytes shown per field, all when None
+        """
+        # pylint: disable-next=import-outside-toplevel,cyclic-import
+        from .printer import _Printer
+
+        self._write_hexdump(_Printer(self, stream, width=width, limit=limit), "")
+
+    def _write_pretty(self, printer, indent, lead):
+        printer.line(self, lead + " " * indent + f"+{self._name}\n")
+        self._write_pretty_children(printer, self._children, indent)
+
+    @staticmethod
+    def _write_pretty_children(printer, children, indent):
+        for name, child in children.items():
+            if isinstance(child, DFContainer):
+                child._write_pretty(printer, indent + 1, "|")
             else:
-                ret += (
-                    "|"
-                    + self._children[child].pretty_print(indent + 1)
-                    + f" : {child} "
-                    + "\n"
+                printer.line(
+                    child, "|" + child.pretty_print(indent + 1) + f" : {name} \n"
                 )
-        return ret
+
+    def _write_hexdump(self, printer, path):
+        for name, child in self._children.items():
+            child_path = f"{path}.{name}" if path else name
+            if isinstance(child, DFContainer):
+                child._write_hexdump(printer, child_path)
+            else:
+                printer.dump(*printer.spans[id(child)], child_path)
 
 
 class DFLength(DFContainer):
@@ -345,66 +533,118 @@ class DFLength(DFContainer):
 
     def __init__(self, field, container):
         super().__init__()
-        self._field = field
         self._children["_data"] = container
+        self._field = field
+        container._parent = self
+        _structure_changed(self)
 
-    def __getattribute__(self, name):
-        if name != "_children" and name in self._children["_data"]._children.keys():
-            return self._children["_data"]._children[name]
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["_children"]["_data"]._children[name]
+        except KeyError:
+            raise AttributeError(name) from None
 
-        return super(DFContainer, self).__getattribute__(name)
+    def add(self, name, obj):
+        super().add(name, obj)
+        if name.startswith("_data."):
+            child = name[len("_data.") :]
+            if "." not in child and not child.startswith("_"):
+                self.__dict__[child] = obj
+        return self
 
     def __setattr__(self, name, obj):
         if isinstance(obj, DFBasicDataType) and not name.startswith("_"):
             self.add("_data." + name, obj)
-        else:
+        elif not self._set_child_value(name, obj):
             super(DFContainer, self).__setattr__(name, obj)
 
-    def pack(self):
-        data = b""
-        children = self._get_children()
-        while len(children):
-            child = children.pop()
-            if isinstance(child, DFBasicDataType):
-                data = child.pack() + data
-            else:
-                data = repr(child) + data
-
-        self._field.value = len(data)
-        return self._field.pack() + data
+    def _iter_chunks(self):
+        if self._incremental:
+            yield self._packed()
+            return
+        data = self._children["_data"]
+        self._field.value = data.nbytes
+        yield self._field.pack()
+        yield from data._iter_chunks()
+
+    def _pack_to(self, fileobj, ctx):
+        if self._incremental:
+            fileobj.write(self._packed())
+            return
+        # Reserve the length field, write the data, then seek back to it
+        data = self._children["_data"]
+        position = fileobj.tell()
+        fileobj.write(bytes(self._field.length))
+        start = fileobj.tell()
+        data._pack_to(fileobj, ctx)
+        end = fileobj.tell()
+        if id(data) in ctx.targets:
+            ctx.spans[id(data)] = (start, end)
+        self._field.value = end - start
+        fileobj.seek(position)
+        fileobj.write(self._field.pack())
+        fileobj.seek(end)
+
+    def _write_into(self, buf, offset, ctx):
+        # Write the data after the length field, then fill the length in
+        data = self._children["_data"]
+        start = offset + self._field.length
+        end = data._pack_into(buf, start, ctx)
+        if ctx is not None and id(data) in ctx.targets:
+            ctx.spans[id(data)] = (start, end)
+        self._field.value = end - start
+        self._field._pack_into(buf, offset, None)
+        return end
 
     @property
+    @_child_first
     def value(self):
-        data = b""
-        children = self._get_children()
-        while len(children):
-            child = children.pop()
-            if isinstance(child, DFBasicDataType):
-                data = child.pack() + data
-            else:
-                data = repr(child) + data
-        self._field.value = len(data)
+        self._field.value = self._children["_data"].nbytes
         return self._field.value
 
+    @property
+    def nbytes(self) -> int:
+        if self._cache is not None:
+            return len(self._cache)
+        return self._field.length + self._children["_data"].nbytes
+
+    def _fixed_nbytes(self):
+        size = self._children["_data"]._fixed_nbytes()
+        if size is None:
+            return None
+        return self._field.length + size
+
+    def _unpack_from(self, view, offset, end, ctx):
+        start = self._field._unpack_from(view, offset, end, ctx)
+        if ctx.spans is None:
+            length = self._field.value
+        else:
+            length = _read_field(self._field, view, offset)
+        data_end = start + length
+        if data_end > end:
+            raise DFRangeException("Length field exceeds the data")
+        self._children["_data"]._unpack_from(view, start, data_end, ctx)
+        if ctx.spans is not None:
+            ctx.spans[id(self)] = (offset, data_end)
+        elif self._incremental:
+            self._invalidate()
+        return data_end
+
     def __str__(self):
         return self.pretty_print()
 
-    def pretty_print(self, indent=0):
-        ret = " " * indent + f"+{self.name} length: 0x{self.value:0x}\n"
-        for child in self._children["_data"]._children:
-            logging.debug("current child: %s (%s)", child, indent)
-            if isinstance(self._children["_data"]._children[child], DFContainer):
-                ret += "|" + self._children["_data"]._children[child].pretty_print(
-                    indent + 1
-                )
-            else:
-                ret += (
-                    "|"
-                    + self._children["_data"]._children[child].pretty_print(indent + 1)
-                    + f" : {child} "
-                    + "\n"
-                )
-        return ret
+    def _write_pretty(self, printer, indent, lead):
+        data = self._children["_data"]
+        start, end = printer.spans[id(data)]
+        header = f"+{self._name} length: 0x{end - start:0x}\n"
+        printer.line(self, lead + " " * indent + header)
+        self._write_pretty_children(printer, data._children, indent)
+
+    def _write_hexdump(self, printer, path):
+        start = printer.spans[id(self)][0]
+        prefix = f"{path}." if path else ""
+        printer.dump(start, start + self._field.length, prefix + "_field")
+        self._children["_data"]._write_hexdump(printer, prefix + "_data")
 
 
 class DFLengthRef(DFContainer):
@@ -414,42 +654,108 @@ class DFLengthRef(DFContainer):
         super().__init__()
         self._field = field
         self._ref = container_ref
-        # self._children["_data"] = container_ref
+        # (structure version, referenced node)
+        self._resolved = None
 
     def _get_root(self, obj) -> DFBasicDataType:
-        if obj.parent is None:
-            return obj
-        return self._get_root(obj.parent)
+        return _ref_root(obj)
 
     def _get_children(self):
         """Returns the length someones children"""
-        root = self._get_root(self)
-        # a.b.c -> a, b, c
-        obj = root
-        path_parts = self._ref.split(".")
-        for part in path_parts:
-            obj = obj._children[part]
+        return _resolve_ref(self)
 
-        return obj
+    def _measure(self, target) -> int:
+        """Field value for the referenced branch"""
+        return target.nbytes
 
-    def pack(self):
+    def _to_nbytes(self, _target, value) -> int:
+        """Packed size of the referenced branch for a decoded field value"""
+        return value
+
+    def _measure_size(self, _target, size) -> int:
+        """Field value for the referenced branch, given its packed size"""
+        return size
+
+    def _write_into(self, buf, offset, ctx):
         children = self._get_children()
-        self._field.value = len(children.pack())
-        return self._field.pack()
+        if ctx is not None and id(children) in ctx.targets:
+            # Filled in from the packed branch once the pass is done
+            ctx.patches.append((self, offset))
+            return offset + self._field.length
+        self._field.value = self._measure(children)
+        return self._field._pack_into(buf, offset, None)
+
+    def _iter_chunks(self):
+        self._field.value = self._measure(self._get_children())
+        yield self._field.pack()
+
+    def _pack_to(self, fileobj, ctx):
+        if id(self._get_children()) in ctx.targets:
+            # Filled in from the written branch once it is done
+            ctx.patches.append((self, fileobj.tell()))
+            fileobj.write(bytes(self._field.length))
+            return
+        fileobj.write(next(self._iter_chunks()))
 
     @property
     def value(self):
         children = self._get_children()
-        self._field.value = len(children.pack())
+        self._field.value = self._measure(children)
         return self._field.value
 
+    def _unpack_from(self, view, offset, end, ctx):
+        start = offset
+        offset = self._field._unpack_from(view, offset, end, ctx)
+        children = self._get_children()
+        if ctx.spans is None:
+            value = self._field.value
+        else:
+            value = _read_field(self._field, view, start)
+            ctx.spans[id(self)] = (start, offset)
+        ctx.bounds[id(children)] = self._to_nbytes(children, value)
+        return offset
+
+    @property
+    def nbytes(self) -> int:
+        return self._field.length
+
+    def _fixed_nbytes(self):
+        return self._field.length
+
     def __str__(self):
         return self.pretty_print()
 
     def pretty_print(self, indent=0):
-        ret = " " * indent + f"+{self.name} length: 0x{self.value:0x}\n"
+        return self._format(indent, self.value)
 
-        return ret
+    def _format(self, indent, value):
+        return " " * indent + f"+{self._name} length: 0x{value:0x}\n"
+
+    def _write_pretty(self, printer, indent, lead):
+        printer.line(self, lead + self._format(indent, printer.field(self)))
+
+    def _write_hexdump(self, printer, path):
+        printer.dump(*printer.spans[id(self)], path)
+
+
+class DFCountRef(DFLengthRef):
+    """Element count of a DFArray, referencing another part of the tree"""
+
+    def _measure(self, target) -> int:
+        if not isinstance(target, DFArray):
+            raise DFTypeException("DFCountRef must reference a DFArray")
+        return target.count
+
+    def _to_nbytes(self, target, value) -> int:
+        if not isinstance(target, DFArray):
+            raise DFTypeException("DFCountRef must reference a DFArray")
+        return value * target._width
+
+    def _measure_size(self, target, size) -> int:
+        return self._measure(target)
+
+    def _format(self, indent, value):
+        return " " * indent + f"+{self._name} count: 0x{value:0x}\n"
 
 
 class DFCallableRef(DFContainer):
@@ -460,41 +766,215 @@ class DFCallableRef(DFContainer):
         self._field = field
         self._func = func
         self._ref = container_ref
+        # (structure version, referenced node)
+        self._resolved = None
 
     def _get_root(self, obj) -> DFBasicDataType:
-        if obj.parent is None:
-            return obj
-        return self._get_root(obj.parent)
+        return _ref_root(obj)
 
     def _get_children(self):
         """Returns children of the branch referred to"""
-        root = self._get_root(self)
-        # a.b.c -> a, b, c
-        obj = root
-        path_parts = self._ref.split(".")
-        for part in path_parts:
-            obj = obj._children[part]
+        return _resolve_ref(self)
 
-        return obj
+    def _compute(self, target):
+        """Field value for the referenced branch"""
+        return self._func(target.pack())
 
-    def pack(self):
+    def _compute_span(self, buf, start, end):
+        """Field value for the referenced branch, packed at buf[start:end]"""
+        return self._func(bytes(buf[start:end]))
+
+    def _write_into(self, buf, offset, ctx):
         children = self._get_children()
-        self._field.value = self._func(children.pack())
-        return self._field.pack()
+        if ctx is not None and id(children) in ctx.targets:
+            # Computed over the packed branch once the pass is done
+            ctx.patches.append((self, offset))
+            return offset + self.nbytes
+        self._field.value = self._compute(children)
+        return self._field._pack_into(buf, offset, None)
+
+    def _iter_chunks(self):
+        self._field.value = self._compute(self._get_children())
+        yield self._field.pack()
+
+    def _pack_to(self, fileobj, ctx):
+        fileobj.write(next(self._iter_chunks()))
 
     @property
     def value(self):
         children = self._get_children()
-        self._field.value = self._func(children.pack())
+        self._field.value = self._compute(children)
         return self._field.value
 
+    def _unpack_from(self, view, offset, end, ctx):
+        end = self._field._unpack_from(view, offset, end, ctx)
+        if ctx.spans is not None:
+            ctx.spans[id(self)] = (offset, end)
+        return end
+
+    @property
+    def nbytes(self) -> int:
+        return self._field.length
+
+    def _fixed_nbytes(self):
+        return self._field.length
+
     def __str__(self):
         return self.pretty_print()
 
     def pretty_print(self, indent=0):
-        ret = " " * indent + f"+{self.name} value: 0x{self.value:0x}\n"
+        return self._format(indent, self.value)
+
+    def _format(self, indent, value):
+        return " " * indent + f"+{self._name} value: 0x{value:0x}\n"
+
+    def _write_pretty(self, printer, indent, lead):
+        printer.line(self, lead + self._format(indent, printer.field(self)))
+
+    def _write_hexdump(self, printer, path):
+        printer.dump(*printer.spans[id(self)], path)
+
 
-        return ret
+def _ref_root(node):
+    """Returns the container reference paths from node start at
+
+    That is the top of the tree, or the data container of the innermost
+    DFLength above node.
+    """
+    parent = node._parent
+    while parent is not None:
+        if isinstance(parent, DFLength) and node is parent._children["_data"]:
+            return node
+        node, parent = parent, parent._parent
+    return node
+
+
+def _resolve_ref(ref):
+    """Returns the node a reference points at
+
+    The node is cached on the reference until the structure of its tree
+    changes, and lookups from the root share the root's path index.
+    """
+    version = _structure_version(ref)
+    resolved = ref._resolved
+    if resolved is not None and resolved[0] == version:
+        return resolved[1]
+
+    obj = ref._get_root(ref)._lookup(ref._ref)
+    if ref._incremental:
+        # Repack this field whenever the referenced branch changes
+        target = obj if isinstance(obj, DFContainer) else obj._parent
+        if target._dependents is None:
+            target._dependents = set()
+        target._dependents.add(ref)
+    ref._resolved = (version, obj)
+    return obj
+
+
+class _PackContext:
+    """State shared by the nodes of one top-level pack
+
+    targets holds the ids of referenced nodes, whose (start, end) offsets
+    are recorded in spans as they are written. References to them add
+    (ref, offset) to patches and are filled in by finish, so every
+    referenced branch is packed once per pack.
+    """
+
+    __slots__ = ("targets", "spans", "patches")
+
+    def __init__(self, targets):
+        self.targets = targets
+        self.spans = {}
+        self.patches = []
+
+    def finish_to(self, fileobj):
+        """Fills in the deferred length fields of a file written by pack_to"""
+        for ref, position in self.patches:
+            target = ref._get_children()
+            span = self.spans.get(id(target))
+            if span is None:
+                ref._field.value = ref._measure(target)
+            else:
+                ref._field.value = ref._measure_size(target, span[1] - span[0])
+            fileobj.seek(position)
+            fileobj.write(ref._field.pack())
+
+    def finish(self, buf):
+        """Fills in the deferred reference fields of buf"""
+        callables = []
+        for ref, offset in self.patches:
+            if isinstance(ref, DFCallableRef):
+                callables.append((ref, offset))
+                continue
+            target = ref._get_children()
+            span = self.spans.get(id(target))
+            if span is None:
+                ref._field.value = ref._measure(target)
+            else:
+                ref._field.value = ref._measure_size(target, span[1] - span[0])
+            ref._field._pack_into(buf, offset, None)
+
+        # A callable covering another callable's field runs after it
+        ordered = []
+        visiting = set()
+
+        def visit(index):
+            if index in visiting:
+                return
+            visiting.add(index)
+            span = self.spans.get(id(callables[index][0]._get_children()))
+            if span is not None:
+                for other, (_, offset) in enumerate(callables):
+                    if span[0] <= offset < span[1]:
+                        visit(other)
+            ordered.append(callables[index])
+
+        for index in range(len(callables)):
+            visit(index)
+
+        for ref, offset in ordered:
+            target = ref._get_children()
+            span = self.spans.get(id(target))
+            if span is None:
+                ref._field.value = ref._compute(target)
+            else:
+                ref._field.value = ref._compute_span(buf, span[0], span[1])
+            ref._field._pack_into(buf, offset, None)
+
+
+def _pack_spans(node):
+    """Packs node once, recording the (start, end) offsets of every node
+
+    Returns:
+        tuple: bytearray of the packed node and a dict of the spans of it
+        and every node below it, keyed by id(node)
+    """
+    nodes = set()
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        nodes.add(id(current))
+        if isinstance(current, DFContainer):
+            stack.extend(current._children.values())
+    ctx = _PackContext(nodes)
+    buf = bytearray(node.nbytes)
+    end = node._write_into(buf, 0, ctx)
+    ctx.spans[id(node)] = (0, end)
+    ctx.finish(buf)
+
+    # Incremental branches are copied from their cache, so find the
+    # offsets inside them from their bytes
+    stack = list(node._children.values())
+    while stack:
+        current = stack.pop()
+        if not isinstance(current, DFContainer):
+            continue
+        if current._incremental:
+            start, end = ctx.spans[id(current)]
+            current._unpack_from(buf, start, end, _UnpackContext(ctx.spans))
+        else:
+            stack.extend(current._children.values())
+    return buf, ctx.spans
 
 
 def main():
@@ -0,0 +1,895 @@
+"""DataForge leaf data types
+"""
+
+import abc
+import array
+import asyncio
+import binascii
+import os
+import struct
+import sys
+from enum import Enum
+
+from .exceptions import DFEndianException, DFRangeException, DFTypeException
+
+# Smaller pieces are copied into a shared segment by pack_iov
+_IOV_MIN_SEGMENT = 1024
+
+# Bytes read from a file at a time by DFFileBuffer
+_FILE_CHUNK = 1 << 20
+
+# Default chunk size of apack and write_to
+_ASYNC_CHUNK = 1 << 16
+
+# Pieces apack packs before handing control back to the event loop
+_ASYNC_PIECES = 1024
+
+
+class DFEndian(Enum):
+    """DFEndian
+
+    Args:
+        Enum (int): Endian
+    """
+
+    LITTLE = 1
+    BIG = 2
+
+
+class _UnpackContext:  # pylint: disable=too-few-public-methods
+    """State of one unpack
+
+    bounds maps id(node) to the packed size of nodes whose size was read
+    from a DFLengthRef earlier in the data. When spans is a dict, nothing is
+    decoded and the (start, end) of each node is recorded in it under
+    id(node) instead.
+    """
+
+    __slots__ = ("bounds", "spans")
+
+    def __init__(self, spans=None):
+        self.bounds = {}
+        self.spans = spans
+
+
+class DFBasicDataType(abc.ABC):
+    """DFBasicDataType
+
+    Abstract base class for all data types
+    """
+
+    __slots__ = ()
+
+    def __init__(self):
+        pass
+
+    @property
+    def value(self):
+        pass
+
+    @value.setter
+    def value(self, value):
+        pass
+
+    @abc.abstractmethod
+    def pack(self):
+        pass
+
+    def _changed(self):
+        """Marks the containers above this node dirty"""
+        parent = getattr(self, "_parent", None)
+        if parent is not None and parent._incremental:
+            parent._invalidate()
+
+    def pack_into(self, buf, offset=0):
+        """Packs into a writable buffer at offset
+
+        Args:
+            buf: bytearray, memoryview, mmap or other writable buffer
+            offset (int): Position in buf to start writing at
+
+        Returns:
+            int: Offset just past the packed data
+        """
+        return self._pack_into(buf, offset, None)
+
+    def pack_to(self, fileobj, seekable=None) -> int:
+        """Writes the packed form to a binary file without building it
+
+        Seekable targets get a placeholder for every DFLength field, filled
+        in by seeking back once the data is written. Other targets are
+        written in one pass, sizing each DFLength up front from nbytes.
+        Either way only one leaf is held packed at a time.
+
+        Args:
+            fileobj: Binary file, mmap or other object with write()
+            seekable (bool): Back-patch lengths, defaults to whether
+                fileobj can seek. Files opened for appending are always
+                written in one pass
+
+        Returns:
+            int: Number of bytes written
+        """
+        mode = getattr(fileobj, "mode", "")
+        if isinstance(mode, str) and "a" in mode:
+            # Every write goes to the end of the file, so none can be patched
+            seekable = False
+        elif seekable is None:
+            if hasattr(fileobj, "seekable"):
+                seekable = fileobj.seekable()
+            else:
+                seekable = hasattr(fileobj, "seek")
+        if seekable:
+            return self._pack_seekable(fileobj)
+
+        written = 0
+        for chunk in self._iter_chunks():
+            fileobj.write(chunk)
+            written += len(chunk)
+        return written
+
+    def _pack_seekable(self, fileobj) -> int:
+        """pack_to on a file that can seek back over what was written"""
+        return self.pack_to(fileobj, False)
+
+    def pack_iov(self, min_segment=_IOV_MIN_SEGMENT) -> list:
+        """Packs into a list of buffer segments for os.writev and friends
+
+        Pieces of at least min_segment bytes, such as DFBuffer payloads,
+        become memoryviews of the objects holding them, without a copy.
+        Smaller pieces are copied back to back into shared bytearrays.
+        The segments are only valid until the tree is next changed.
+
+        Args:
+            min_segment (int): Smallest piece given its own segment
+
+        Returns:
+            list: bytes-like segments in output order, for os.writev,
+            socket.sendmsg or a transport's writelines
+        """
+        segments = []
+        pending = bytearray()
+        for chunk in self._iter_chunks():
+            if len(chunk) < min_segment:
+                pending += chunk
+                continue
+            if pending:
+                segments.append(pending)
+                pending = bytearray()
+            segments.append(memoryview(chunk))
+        if pending:
+            segments.append(pending)
+        return segments
+
+    async def apack(self, chunk_size=_ASYNC_CHUNK):
+        """Asynchronously yields the packed form in chunks
+
+        Packs in one pass like pack_to on a non-seekable file, so large
+        trees never block the event loop for long: control goes back to
+        the loop after every chunk and every few hundred fields.
+
+        Args:
+            chunk_size (int): Largest chunk to yield
+
+        Yields:
+            bytes-like chunks of at most chunk_size bytes
+        """
+        pending = bytearray()
+        pieces = 0
+        for piece in self._iter_chunks():
+            if len(pending) + len(piece) <= chunk_size:
+                pending += piece
+            else:
+                if pending:
+                    yield pending
+                    pending = bytearray()
+                    await asyncio.sleep(0)
+                # Whole slices go out as they are, the rest is kept
+                view = memoryview(piece).cast("B")
+                whole = len(view) - len(view) % chunk_size
+                for start in range(0, whole, chunk_size):
+                    yield view[start : start + chunk_size]
+                    await asyncio.sleep(0)
+                pending += view[whole:]
+            pieces += 1
+            if pieces == _ASYNC_PIECES:
+                pieces = 0
+                await asyncio.sleep(0)
+        if pending:
+            yield pending
+
+    async def write_to(self, writer, chunk_size=_ASYNC_CHUNK) -> int:
+        """Writes the packed form to an asyncio.StreamWriter
+
+        Waits on writer.drain() after every chunk, so a slow peer holds
+        back the packing instead of filling the transport buffer.
+
+        Args:
+            writer (asyncio.StreamWriter): Stream to write to
+            chunk_size (int): Largest chunk to write at a time
+
+        Returns:
+            int: Number of bytes written
+        """
+        written = 0
+        async for chunk in self.apack(chunk_size):
+            writer.write(chunk)
+            written += len(chunk)
+            await writer.drain()
+        return written
+
+    def _iter_chunks(self):
+        """Yields the packed form of this node in pieces"""
+        yield self.pack()
+
+    def _pack_to(self, fileobj, _ctx):
+        """Writes to a seekable fileobj as part of the pack described by ctx"""
+        for chunk in self._iter_chunks():
+            fileobj.write(chunk)
+
+    def _pack_into(self, buf, offset, _ctx):
+        """Packs into buf at offset as part of the pack described by ctx
+
+        ctx is the _PackContext of the enclosing top-level pack, or None.
+        """
+        data = self.pack()
+        end = offset + len(data)
+        if end > len(buf):
+            raise DFRangeException("Buffer too small for " + type(self).__name__)
+        buf[offset:end] = data
+        return end
+
+    @property
+    def length(self):
+        pass
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the packed data, computed without packing"""
+        return len(self.pack())
+
+    def _fixed_nbytes(self):
+        """Packed size if it does not depend on the data, otherwise None"""
+        return None
+
+    def unpack(self, buffer, offset=0):
+        """Decodes packed data from buffer into this node's values
+
+        Args:
+            buffer: bytes, bytearray, memoryview, mmap or other buffer
+            offset (int): Position in buffer to start decoding at
+
+        Returns:
+            int: Offset just past the decoded data
+        """
+        with memoryview(buffer) as view:
+            with view.cast("B") as data:
+                offset = self._unpack_from(data, offset, len(data), _UnpackContext())
+        self._changed()
+        return offset
+
+    def _unpack_from(self, view, offset, end, ctx):
+        """Decodes from view[offset:end], returning the new offset
+
+        ctx is the _UnpackContext of the enclosing top-level unpack.
+        """
+        raise DFTypeException(f"{type(self).__name__} cannot be unpacked")
+
+
+class DFUInt8(DFBasicDataType):
+    """Unsigned int 8-bit"""
+
+    # Format and width are per class, instances only hold their state
+    __slots__ = ("_value", "_parent")
+    _fmt = "B"
+    _width = 1
+
+    def __init__(self, value=0):
+        self._parent = None
+        self.value = value
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, val):
+        if isinstance(val, int):
+            self._value = val & 0xFF
+        elif isinstance(val, bytes):
+            if len(val) > 1:
+                raise DFRangeException
+            self._value = ord(val)
+        else:
+            raise DFTypeException
+        self._changed()
+
+    def pack(self):
+        return struct.pack(self._fmt, self._value)
+
+    def _pack_into(self, buf, offset, _ctx):
+        if offset + self._width > len(buf):
+            raise DFRangeException("Buffer too small for " + type(self).__name__)
+        struct.pack_into(self._fmt, buf, offset, self._value)
+        return offset + self._width
+
+    def _fixed_nbytes(self):
+        return self._width
+
+    def _unpack_from(self, view, offset, end, ctx):
+        if offset + self._width > end:
+            raise DFRangeException("Not enough data for " + type(self).__name__)
+        if ctx.spans is None:
+            self._value = struct.unpack_from(self._fmt, view, offset)[0]
+        else:
+            ctx.spans[id(self)] = (offset, offset + self._width)
+        return offset + self._width
+
+    @property
+    def length(self):
+        return self._width
+
+    @property
+    def nbytes(self) -> int:
+        return self._width
+
+    def __str__(self):
+        return self.pretty_print()
+
+    def pretty_print(self, indent=0):
+        return " " * indent + "|- " + f"Unsigned Byte 0x{self.value:02X}"
+
+
+class DFSInt8(DFUInt8):
+    """Signed int 8-bit"""
+
+    __slots__ = ()
+
+    def pretty_print(self, indent=0):
+        return " " * indent + "|- " + f"Signed Byte 0x{self.value:02X}"
+
+
+class DFUInt16(DFBasicDataType):
+    """Unsigned int 16-bit"""
+
+    __slots__ = ("_value", "_parent", "_endian")
+    _fmt = "H"
+    _width = 2
+
+    def __init__(self, value=0, endian=DFEndian.LITTLE):
+        if endian == DFEndian.LITTLE:
+            self._endian = "<"
+        elif endian == DFEndian.BIG:
+            self._endian = ">"
+        else:
+            raise DFEndianException
+        self._parent = None
+        self.value = value
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, val):
+        if isinstance(val, int):
+            self._value = val & 0xFFFF
+        else:
+            if len(val) > 2:
+                raise DFRangeException
+            self._value = struct.unpack("@" + self._fmt, val)[0]
+        self._changed()
+
+    def pack(self):
+        return struct.pack(self._endian + self._fmt, self.value)
+
+    def _pack_into(self, buf, offset, _ctx):
+        if offset + self._width > len(buf):
+            raise DFRangeException("Buffer too small for " + type(self).__name__)
+        struct.pack_into(self._endian + self._fmt, buf, offset, self._value)
+        return offset + self._width
+
+    def _fixed_nbytes(self):
+        return self._width
+
+    def _unpack_from(self, view, offset, end, ctx):
+        if offset + self._width > end:
+            raise DFRangeException("Not enough data for " + type(self).__name__)
+        if ctx.spans is None:
+            self._value = struct.unpack_from(self._endian + self._fmt, view, offset)[0]
+        else:
+            ctx.spans[id(self)] = (offset, offset + self._width)
+        return offset + self._width
+
+    @property
+    def length(self):
+        return self._width
+
+    @property
+    def nbytes(self) -> int:
+        return self._width
+
+    def __str__(self):
+        return self.pretty_print()
+
+    def pretty_print(self, indent=0):
+        return " " * indent + "|- " + f"Unsigned Short 0x{self.value:04X}"
+
+
+class DFSInt16(DFUInt16):
+    """docstring for DFSInt16"""
+
+    __slots__ = ()
+
+    def pretty_print(self, indent=0):
+        return " " * indent + "|- " + f"Signed Short 0x{self.value:04X}"
+
+
+class DFUInt32(DFBasicDataType):
+    """Unsigned int 32-bit"""
+
+    __slots__ = ("_value", "_parent", "_endian")
+    _fmt = "I"
+    _width = 4
+
+    def __init__(self, value=0, endian=DFEndian.LITTLE):
+        if endian == DFEndian.LITTLE:
+            self._endian = "<"
+        elif endian == DFEndian.BIG:
+            self._endian = ">"
+        else:
+            raise DFEndianException
+        self._parent = None
+        self.value = value
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, val):
+        if isinstance(val, int):
+            self._value = val & 0xFFFFFFFF
+        else:
+            if len(val) > 4:
+                raise DFRangeException
+            self._value = struct.unpack("@" + self._fmt, val)[0]
+        self._changed()
+
+    def pack(self):
+        return struct.pack(self._endian + self._fmt, self.value)
+
+    def _pack_into(self, buf, offset, _ctx):
+        if offset + self._width > len(buf):
+            raise DFRangeException("Buffer too small for " + type(self).__name__)
+        struct.pack_into(self._endian + self._fmt, buf, offset, self._value)
+        return offset + self._width
+
+    def _fixed_nbytes(self):
+        return self._width
+
+    def _unpack_from(self, view, offset, end, ctx):
+        if offset + self._width > end:
+            raise DFRangeException("Not enough data for " + type(self).__name__)
+        if ctx.spans is None:
+            self._value = struct.unpack_from(self._endian + self._fmt, view, offset)[0]
+        else:
+            ctx.spans[id(self)] = (offset, offset + self._width)
+        return offset + self._width
+
+    @property
+    def length(self):
+        return self._width
+
+    @property
+    def nbytes(self) -> int:
+        return self._width
+
+    def __str__(self):
+        return self.pretty_print()
+
+    def pretty_print(self, indent=0):
+        return " " * indent + "|- " + f"Unsigned Long 0x{self.value:08X}"
+
+
+class DFSInt32(DFUInt32):
+    """docstring for DFSInt32"""
+
+    __slots__ = ()
+
+    def pretty_print(self, indent=0):
+        return " " * indent + "|- " + f"Signed Long 0x{self.value:08X}"
+
+
+class DFBuffer(DFBasicDataType):
+    """Buffer data type"""
+
+    __slots__ = ("_value", "_parent")
+
+    def __init__(self, value=b""):
+        self._parent = None
+        self._value = value
+
+    @property
+    def length(self):
+        return len(self._value)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._value)
+
+    def pack(self):
+        return self.value
+
+    def _iter_chunks(self):
+        yield self._value
+
+    def _pack_into(self, buf, offset, _ctx):
+        end = offset + len(self._value)
+        if end > len(buf):
+            raise DFRangeException("Buffer too small for DFBuffer")
+        buf[offset:end] = self._value
+        return end
+
+    def _unpack_from(self, view, offset, end, ctx):
+        # A buffer takes everything up to the end of its enclosing bound
+        if ctx.spans is None:
+            self._value = bytes(view[offset:end])
+        else:
+            ctx.spans[id(self)] = (offset, end)
+        return end
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, val):
+        if isinstance(val, bytes):
+            self._value = val
+        else:
+            raise DFTypeException("DFBuffer must be type: bytes")
+        self._changed()
+
+    def pretty_print(self, indent=0):
+        short_val = str(binascii.hexlify(self._value[:10]))
+        if self.length > 10:
+            short_val += "..."
+        return " " * indent + "|- " + f"Buffer {short_val}"
+
+
+def _pread(fileno, size, offset) -> bytes:
+    """Reads up to size bytes at offset, leaving the file position alone"""
+    if hasattr(os, "pread"):
+        return os.pread(fileno, size, offset)
+    os.lseek(fileno, offset, os.SEEK_SET)
+    return os.read(fileno, size)
+
+
+def _preadinto(fileno, view, offset) -> int:
+    """Reads into view from offset, returning the number of bytes read"""
+    if hasattr(os, "preadv"):
+        return os.preadv(fileno, [view], offset)
+    data = _pread(fileno, len(view), offset)
+    view[: len(data)] = data
+    return len(data)
+
+
+class DFFileBuffer(DFBuffer):
+    """Buffer data type backed by a file, file descriptor or mmap
+
+    The payload is read from its source while packing, a chunk at a time,
+    and is never held whole by the node. Setting value or unpacking into
+    the node replaces the source with an in-memory value.
+    """
+
+    __slots__ = ("_source", "_offset", "_size")
+
+    def __init__(self, source, offset=0, length=None):
+        """
+        Args:
+            source: Path of a file, an open file descriptor, or an mmap or
+                other bytes-like object
+            offset (int): Position of the payload in source
+            length (int): Size of the payload, defaults to the rest of
+                source
+        """
+        super().__init__()
+        if isinstance(source, int):
+            size = os.fstat(source).st_size
+        elif isinstance(source, (str, os.PathLike)):
+            size = os.stat(source).st_size
+        else:
+            size = memoryview(source).nbytes
+        if length is None:
+            length = size - offset
+        if offset < 0 or length < 0 or offset + length > size:
+            raise DFRangeException(
+                f"Range {offset}+{length} is outside a {size} byte source"
+            )
+        self._source = source
+        self._offset = offset
+        self._size = length
+
+    @property
+    def length(self):
+        if self._source is None:
+            return len(self._value)
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        return self.length
+
+    def _open(self):
+        """Returns a file descriptor and whether it is ours to close"""
+        if isinstance(self._source, int):
+            return self._source, False
+        return os.open(self._source, os.O_RDONLY | getattr(os, "O_BINARY", 0)), True
+
+    def _iter_chunks(self):
+        if self._source is None:
+            yield self._value
+            return
+        if not isinstance(self._source, (int, str, os.PathLike)):
+            start = self._offset
+            yield memoryview(self._source).cast("B")[start : start + self._size]
+            return
+
+        fileno, owned = self._open()
+        try:
+            position = self._offset
+            end = position + self._size
+            while position < end:
+                chunk = _pread(fileno, min(_FILE_CHUNK, end - position), position)
+                if not chunk:
+                    raise DFRangeException("DFFileBuffer source ended early")
+                position += len(chunk)
+                yield chunk
+        finally:
+            if owned:
+                os.close(fileno)
+
+    def pack(self):
+        return self.value
+
+    def _pack_into(self, buf, offset, ctx):
+        if self._source is None:
+            return super()._pack_into(buf, offset, ctx)
+        end = offset + self._size
+        if end > len(buf):
+            raise DFRangeException("Buffer too small for DFBuffer")
+        if not isinstance(self._source, (int, str, os.PathLike)):
+            buf[offset:end] = next(self._iter_chunks())
+            return end
+
+        # Read straight into the output
+        fileno, owned = self._open()
+        try:
+            with memoryview(buf) as view:
+                view = view.cast("B")
+                position = self._offset
+                while offset < end:
+                    count = _preadinto(fileno, view[offset:end], position)
+                    if not count:
+                        raise DFRangeException("DFFileBuffer source ended early")
+                    offset += count
+                    position += count
+        finally:
+            if owned:
+                os.close(fileno)
+        return end
+
+    def _unpack_from(self, view, offset, end, ctx):
+        if ctx.spans is None:
+            self._source = None
+        return super()._unpack_from(view, offset, end, ctx)
+
+    @property
+    def value(self):
+        if self._source is None:
+            return self._value
+        return b"".join(self._iter_chunks())
+
+    @value.setter
+    def value(self, val):
+        DFBuffer.value.fset(self, val)
+        self._source = None
+
+    def pretty_print(self, indent=0):
+        chunks = self._iter_chunks()
+        head = bytes(next(chunks, b"")[:11])
+        chunks.close()
+        short_val = str(binascii.hexlify(head[:10]))
+        if self.length > 10:
+            short_val += "..."
+        return " " * indent + "|- " + f"Buffer {short_val}"
+
+
+def _array_typecode(signed, width) -> str:
+    """array.array typecode with the given signedness and item size"""
+    for code in "bhilq" if signed else "BHILQ":
+        if array.array(code).itemsize == width:
+            return code
+    raise DFTypeException(f"No array typecode for {width} byte items")
+
+
+_ARRAY_TYPECODES = {
+    DFUInt8: "B",
+    DFSInt8: "b",
+    DFUInt16: _array_typecode(False, 2),
+    DFSInt16: _array_typecode(True, 2),
+    DFUInt32: _array_typecode(False, 4),
+    DFSInt32: _array_typecode(True, 4),
+}
+
+
+class DFArray(DFBasicDataType):
+    """Repeated scalar field packed in one bulk call
+
+    Elements are held in a single array.array instead of one object per
+    element. Buffers with a matching item format, such as another array
+    or a NumPy array, are copied in without per-element conversion.
+
+    value is a read-only view of the elements. Change single elements or
+    slices by indexing the DFArray itself, so incremental containers see
+    the change.
+
+    Args:
+        element_type: One of DFUInt8 through DFSInt32
+        count (int): Fixed number of elements, or None when the array is
+            sized by a DFLength, DFLengthRef or DFCountRef
+        endian (DFEndian): Byte order of the elements
+        value: Initial elements, zeros when not given
+    """
+
+    __slots__ = ("_value", "_parent", "_typecode", "_width", "_swap", "_count")
+
+    def __init__(
+        self, element_type=DFUInt8, count=None, endian=DFEndian.LITTLE, value=None
+    ):
+        if element_type not in _ARRAY_TYPECODES:
+            raise DFTypeException(f"Cannot make an array of {element_type}")
+        self._typecode = _ARRAY_TYPECODES[element_type]
+        self._width = array.array(self._typecode).itemsize
+        if endian == DFEndian.LITTLE:
+            self._swap = self._width > 1 and sys.byteorder != "little"
+        elif endian == DFEndian.BIG:
+            self._swap = self._width > 1 and sys.byteorder != "big"
+        else:
+            raise DFEndianException
+        self._count = count
+        self._parent = None
+        self.value = [0] * (count or 0) if value is None else value
+
+    @property
+    def value(self):
+        return memoryview(self._value).toreadonly()
+
+    @value.setter
+    def value(self, val):
+        if isinstance(val, array.array) and val.typecode == self._typecode:
+            values = val
+        else:
+            values = array.array(self._typecode)
+            try:
+                with memoryview(val) as view:
+                    if view.format != self._typecode:
+                        raise TypeError
+                    values.frombytes(view)
+            except TypeError:
+                try:
+                    values.extend(val)
+                except OverflowError as exc:
+                    raise DFRangeException(str(exc)) from exc
+                except TypeError as exc:
+                    raise DFTypeException(str(exc)) from exc
+        if self._count is not None and len(values) != self._count:
+            raise DFRangeException(f"DFArray needs exactly {self._count} elements")
+        self._value = values
+        self._changed()
+
+    def __getitem__(self, index):
+        return self._value[index]
+
+    def __setitem__(self, index, item):
+        if isinstance(index, slice):
+            values = array.array(self._typecode, self._value)
+            try:
+                values[index] = array.array(self._typecode, item)
+            except OverflowError as exc:
+                raise DFRangeException(str(exc)) from exc
+            except TypeError as exc:
+                raise DFTypeException(str(exc)) from exc
+            self.value = values
+            return
+        try:
+            self._value[index] = item
+        except OverflowError as exc:
+            raise DFRangeException(str(exc)) from exc
+        except TypeError as exc:
+            raise DFTypeException(str(exc)) from exc
+        self._changed()
+
+    @property
+    def count(self) -> int:
+        """Number of elements"""
+        return len(self._value)
+
+    @property
+    def length(self):
+        return self.nbytes
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._value) * self._width
+
+    def _fixed_nbytes(self):
+        if self._count is None:
+            return None
+        return self._count * self._width
+
+    def _wire_values(self):
+        """Elements in wire byte order, byteswapping a copy if needed"""
+        if not self._swap:
+            return self._value
+        values = array.array(self._typecode, self._value)
+        values.byteswap()
+        return values
+
+    def pack(self):
+        return self._wire_values().tobytes()
+
+    def _iter_chunks(self):
+        yield memoryview(self._wire_values()).cast("B")
+
+    def _pack_into(self, buf, offset, _ctx):
+        with memoryview(self._wire_values()) as view:
+            data = view.cast("B")
+            end = offset + len(data)
+            if end > len(buf):
+                raise DFRangeException("Buffer too small for DFArray")
+            buf[offset:end] = data
+        return end
+
+    def _decode(self, data):
+        """Decodes elements from a bytes-like object"""
+        values = array.array(self._typecode)
+        try:
+            values.frombytes(data)
+        except ValueError as exc:
+            raise DFRangeException(str(exc)) from exc
+        if self._swap:
+            values.byteswap()
+        return values
+
+    def _unpack_from(self, view, offset, end, ctx):
+        if self._count is not None:
+            if offset + self._count * self._width > end:
+                raise DFRangeException("Not enough data for DFArray")
+            end = offset + self._count * self._width
+        if ctx.spans is None:
+            self._value = self._decode(view[offset:end])
+        else:
+            ctx.spans[id(self)] = (offset, end)
+        return end
+
+    def __str__(self):
+        return self.pretty_print()
+
+    def pretty_print(self, indent=0):
+        short_val = ", ".join(str(val) for val in self._value[:8])
+        if len(self._value) > 8:
+            short_val += ", ..."
+        return " " * indent + "|- " + f"Array[{len(self._value)}] [{short_val}]"
+
+
+# is a container a basic data type or its own thing?
+def _field_format(field) -> str:
+    """Struct format for a scalar used as a length or reference field"""
+    return getattr(field, "_endian", "<") + field._fmt
+
+
+def _read_field(field, view, offset) -> int:
+    """Decodes a scalar field from view without storing it"""
+    return struct.unpack_from(_field_format(field), view, offset)[0]
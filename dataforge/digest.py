@@ -0,0 +1,100 @@
+"""DataForge running digest references
+"""
+
+import copy
+
+from .dataforge import DFCallableRef
+from .datatypes import DFBuffer
+from .exceptions import DFTypeException
+
+# Bytes fed to a running digest at a time
+_DIGEST_CHUNK = 1 << 20
+
+
+class DFDigestRef(DFCallableRef):
+    """Compute a field with a running checksum or hash over a branch
+
+    The branch is fed to the digest a chunk at a time, so it is never
+    copied out whole.
+    """
+
+    def __init__(self, field, digest, container_ref, initial=None):
+        """
+        Args:
+            field: Field to hold the result. An integer field takes a hash
+                digest as a big-endian integer, a DFBuffer takes it as is.
+            digest: hashlib-style object, copied for every computation, or
+                a running function called as digest(chunk, value), such as
+                zlib.crc32 or zlib.adler32
+            container_ref (str): Path of the branch from the root
+            initial (int): Starting value for a running function, leaving
+                it to use its own default when None
+        """
+        if isinstance(field, DFBuffer) and not hasattr(digest, "digest_size"):
+            raise DFTypeException("A DFBuffer field needs a hashlib-style digest")
+        super().__init__(field, None, container_ref)
+        self._digest = digest
+        self._initial = initial
+
+    def __deepcopy__(self, memo):
+        # hashlib objects copy themselves, but cannot be deep-copied
+        clone = copy.copy(self)
+        memo[id(self)] = clone
+        for name, value in list(clone.__dict__.items()):
+            if name == "_digest" and hasattr(value, "copy"):
+                clone.__dict__[name] = value.copy()
+            else:
+                clone.__dict__[name] = copy.deepcopy(value, memo)
+        return clone
+
+    def _feed(self, chunks):
+        if hasattr(self._digest, "update"):
+            state = self._digest.copy()
+            for chunk in chunks:
+                state.update(chunk)
+            digest = state.digest()
+            if isinstance(self._field, DFBuffer):
+                return digest
+            return int.from_bytes(digest, "big")
+
+        value = self._initial
+        for chunk in chunks:
+            if value is None:
+                value = self._digest(chunk)
+            else:
+                value = self._digest(chunk, value)
+        if value is None:
+            value = self._digest(b"")
+        return value
+
+    def _compute(self, target):
+        return self._feed(target._iter_chunks())
+
+    @property
+    def nbytes(self) -> int:
+        if isinstance(self._field, DFBuffer):
+            return self._digest.digest_size
+        return self._field.length
+
+    def _fixed_nbytes(self):
+        return self.nbytes
+
+    def _unpack_from(self, view, offset, end, ctx):
+        end = min(end, offset + self.nbytes)
+        return super()._unpack_from(view, offset, end, ctx)
+
+    def _compute_span(self, buf, start, end):
+        with memoryview(buf) as view:
+            return self._feed(
+                view[offset : min(offset + _DIGEST_CHUNK, end)]
+                for offset in range(start, end, _DIGEST_CHUNK)
+            )
+
+    def _format(self, indent, value):
+        if isinstance(value, bytes):
+            value = value.hex()
+        else:
+            value = f"{value:0x}"
+        ret = " " * indent + f"+{self._name} digest: 0x{value}\n"
+
+        return ret
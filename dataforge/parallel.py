@@ -0,0 +1,98 @@
+"""DataForge multi-process bulk packing
+"""
+import array
+import collections
+import concurrent.futures
+import itertools
+import os
+
+from .batch import _pack_rows, _plan_for
+
+# Value tuples packed per task
+_BATCH = 4096
+
+# Plan of the schema sent to this worker process
+_WORKER_PLAN = [None]
+
+
+def _init_worker(schema):
+    _WORKER_PLAN[0] = _plan_for(schema)
+
+
+def _pack_shard(rows):
+    return _pack_rows(_WORKER_PLAN[0], len(rows), iter(rows))
+
+
+def _iter_shards(schema, rows, workers, batch_size):
+    """Yields (bytearray, offsets) for each batch of rows, in order
+
+    The schema is pickled once per worker. At most two batches per worker
+    are queued at a time, so rows can be a long-running generator.
+    """
+    workers = workers or os.cpu_count() or 1
+    rows = iter(rows)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(schema,)
+    ) as executor:
+        pending = collections.deque()
+        while True:
+            while len(pending) < 2 * workers:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                pending.append(executor.submit(_pack_shard, batch))
+            if not pending:
+                return
+            yield pending.popleft().result()
+
+
+def pack_parallel(schema, rows, workers=None, batch_size=_BATCH):
+    """Packs one record per value tuple across a pool of processes
+
+    Args:
+        schema: DFContainer or DFPackPlan describing one record, which
+            must pickle, along with any callables its references use
+        rows: Iterable of value tuples in DFPackPlan.fields order
+        workers (int): Number of processes, defaults to one per CPU
+        batch_size (int): Value tuples sent to a process at a time
+
+    Returns:
+        tuple: bytearray and offsets, as returned by pack_batch
+    """
+    out = bytearray()
+    offsets = array.array("Q", [0])
+    for buf, shard_offsets in _iter_shards(schema, rows, workers, batch_size):
+        base = len(out)
+        out += buf
+        offsets.extend(base + offset for offset in shard_offsets[1:])
+    return out, offsets
+
+
+def pack_parallel_to(schema, rows, fileobj, workers=None, batch_size=_BATCH):
+    """Packs records across a pool of processes, writing them to a file
+
+    Takes the same arguments as pack_parallel, with fileobj any object
+    with write(). Only a few batches are held in memory at a time.
+
+    Returns:
+        array.array: count + 1 offsets of the records relative to where
+        writing started
+    """
+    written = 0
+    offsets = array.array("Q", [0])
+    for buf, shard_offsets in _iter_shards(schema, rows, workers, batch_size):
+        fileobj.write(buf)
+        offsets.extend(written + offset for offset in shard_offsets[1:])
+        written += len(buf)
+    return offsets
+
+
+def iter_pack_parallel(schema, rows, workers=None, batch_size=_BATCH):
+    """Yields the packed bytes of one record per value tuple, in order
+
+    Takes the same arguments as pack_parallel.
+    """
+    for buf, offsets in _iter_shards(schema, rows, workers, batch_size):
+        with memoryview(buf) as view:
+            for start, end in zip(offsets, offsets[1:]):
+                yield view[start:end].tobytes()
@@ -0,0 +1,339 @@
+"""DataForge precompiled pack plans
+"""
+
+import array
+import struct
+
+from .dataforge import DFCallableRef, DFContainer, DFCountRef, DFLength, DFLengthRef
+from .datatypes import DFArray, DFBuffer, DFUInt8, DFUInt16, DFUInt32, _field_format
+from .exceptions import DFRangeException, DFTypeException
+
+_OP_STRUCT = 0
+_OP_BUFFER = 1
+_OP_LENGTH_BEGIN = 2
+_OP_LENGTH_END = 3
+_OP_MARK_BEGIN = 4
+_OP_MARK_END = 5
+_OP_REF = 6
+_OP_ARRAY = 7
+
+
+class DFPackPlan:
+    """Precompiled pack plan for a container tree
+
+    Runs of fixed-width scalars are merged into a single struct.Struct and
+    the tree is flattened into a short list of steps, so packing no longer
+    walks the tree. Each scalar and buffer leaf becomes one value slot,
+    named by its dotted path in fields; length and reference fields are
+    computed.
+
+    Plans pickle as their container and are compiled again when loaded.
+
+    Args:
+        container (DFContainer): Tree to compile, refs must resolve within it
+    """
+
+    def __init__(self, container):
+        self._container = container
+        self.fields = []
+        self.defaults = []
+        self._slots = []
+        self._ops = []
+        self._run = []
+        self._run_endian = None
+        self._static_size = 0
+        self._buffer_slots = []
+        self._targets = {}
+        self._refs = []
+
+        self._find_targets(container)
+        self._compile(container, "")
+        self._flush()
+
+        self.fields = tuple(self.fields)
+        self.defaults = tuple(self.defaults)
+        self._patches = self._order_patches()
+        self._single = None
+        if len(self._ops) == 1 and self._ops[0][0] == _OP_STRUCT:
+            self._single = self._ops[0][1]
+
+    def __reduce__(self):
+        return (DFPackPlan, (self._container,))
+
+    def _find_targets(self, node):
+        if isinstance(node, (DFLengthRef, DFCallableRef)):
+            target = node._get_children()
+            self._targets.setdefault(id(target), len(self._targets))
+        elif isinstance(node, DFContainer):
+            for child in node._children.values():
+                self._find_targets(child)
+
+    def _flush(self):
+        if self._run:
+            fmt = "".join(char for char, _ in self._run)
+            packer = struct.Struct((self._run_endian or "<") + fmt)
+            stop = len(self._slots)
+            self._ops.append((_OP_STRUCT, packer, stop - len(self._run), stop))
+            self._static_size += packer.size
+        self._run = []
+        self._run_endian = None
+
+    def _emit(self, *step):
+        self._flush()
+        self._ops.append(step)
+
+    def _compile(self, node, path):
+        slot = self._targets.get(id(node))
+        if slot is not None:
+            self._emit(_OP_MARK_BEGIN, slot)
+
+        if isinstance(node, DFLength):
+            self._compile_length(node, path)
+        elif isinstance(node, (DFLengthRef, DFCallableRef)):
+            field = node._field
+            if not hasattr(field, "_fmt"):
+                raise DFTypeException(
+                    f"{node._ref} needs an integer field to be compiled"
+                )
+            target = self._targets[id(node._get_children())]
+            self._emit(_OP_REF, len(self._refs), field._width)
+            self._static_size += field._width
+            self._refs.append((node, target, len(self._ops) - 1))
+        elif isinstance(node, DFContainer):
+            for name, child in node._children.items():
+                self._compile(child, path + name + ".")
+        elif isinstance(node, DFBuffer):
+            self._emit(_OP_BUFFER, len(self._slots))
+            self._buffer_slots.append((len(self._slots), 1))
+            self._add_slot(node, path, None)
+        elif isinstance(node, DFArray):
+            self._emit(_OP_ARRAY, len(self._slots), node._typecode, node._swap)
+            self._buffer_slots.append((len(self._slots), node._width))
+            self._add_slot(node, path, node._typecode)
+        elif isinstance(node, (DFUInt8, DFUInt16, DFUInt32)):
+            self._compile_scalar(node, path)
+        else:
+            raise DFTypeException(f"Cannot compile {type(node).__name__}")
+
+        if slot is not None:
+            self._emit(_OP_MARK_END, slot)
+
+    def _compile_length(self, node, path):
+        field = node._field
+        self._emit(_OP_LENGTH_BEGIN, field._width)
+        self._static_size += field._width
+        for name, child in node._children["_data"]._children.items():
+            self._compile(child, path + name + ".")
+        self._emit(
+            _OP_LENGTH_END,
+            struct.Struct(_field_format(field)),
+            (1 << (8 * field._width)) - 1,
+            field._width,
+        )
+
+    def _compile_scalar(self, node, path):
+        # Scalars join the current run unless their byte order differs
+        endian = getattr(node, "_endian", None)
+        if node._width > 1 and endian != self._run_endian:
+            if self._run_endian is not None:
+                self._flush()
+            self._run_endian = endian
+        self._run.append((node._fmt, endian))
+        self._add_slot(node, path, node)
+
+    def _add_slot(self, node, path, scalar):
+        self.fields.append(path.rstrip("."))
+        self.defaults.append(node.value)
+        if scalar is None or isinstance(scalar, str):
+            self._slots.append(scalar)
+        else:
+            self._slots.append(
+                (scalar._fmt, scalar._width, (1 << (8 * scalar._width)) - 1)
+            )
+
+    def _order_patches(self):
+        """Orders reference patches so a callable sees final bytes
+
+        A callable whose target covers other reference fields is patched
+        after them.
+        """
+        spans = {}
+        for index, step in enumerate(self._ops):
+            if step[0] == _OP_MARK_BEGIN:
+                spans[step[1]] = [index, None]
+            elif step[0] == _OP_MARK_END:
+                spans[step[1]][1] = index
+        for node, target, _ in self._refs:
+            if target not in spans:
+                raise DFTypeException(f"{node._ref} is outside the compiled tree")
+
+        ordered = []
+        visiting = set()
+
+        def visit(ref_index):
+            if ref_index in visiting or ref_index in ordered:
+                return
+            visiting.add(ref_index)
+            node, target, _ = self._refs[ref_index]
+            if isinstance(node, DFCallableRef):
+                begin, end = spans[target]
+                for other, (_, _, op_index) in enumerate(self._refs):
+                    if other != ref_index and begin < op_index < end:
+                        visit(other)
+            ordered.append(ref_index)
+
+        for ref_index in range(len(self._refs)):
+            visit(ref_index)
+
+        patches = []
+        for ref_index in ordered:
+            node, target, _ = self._refs[ref_index]
+            field = node._field
+            func = None
+            if isinstance(node, DFCallableRef):
+                func = node._compute_span
+            # Counts are the byte span divided by the element width
+            divisor = 1
+            if isinstance(node, DFCountRef):
+                divisor = node._to_nbytes(node._get_children(), 1)
+            patches.append(
+                (
+                    ref_index,
+                    target,
+                    func,
+                    divisor,
+                    struct.Struct(_field_format(field)),
+                    (1 << (8 * field._width)) - 1,
+                )
+            )
+        return patches
+
+    def _normalize(self, values):
+        """Applies the scalar value setter rules to a values tuple"""
+        normalized = []
+        for value, slot in zip(values, self._slots):
+            if slot is None:
+                if not isinstance(value, bytes):
+                    raise DFTypeException("DFBuffer must be type: bytes")
+            elif isinstance(slot, str):
+                pass
+            elif isinstance(value, int):
+                value &= slot[2]
+            elif isinstance(value, bytes):
+                if len(value) > slot[1]:
+                    raise DFRangeException
+                value = struct.unpack("@" + slot[0], value)[0]
+            else:
+                raise DFTypeException
+            normalized.append(value)
+        return normalized
+
+    def _checked(self, values):
+        """Returns values, or the compiled defaults when None"""
+        if values is None:
+            return self.defaults
+        if len(values) != len(self._slots):
+            raise DFRangeException(
+                f"Expected {len(self._slots)} values, got {len(values)}"
+            )
+        return values
+
+    def nbytes(self, values=None) -> int:
+        """Packed size for values, defaulting to the compiled ones"""
+        values = self._checked(values)
+        size = self._static_size
+        for index, width in self._buffer_slots:
+            size += len(values[index]) * width
+        return size
+
+    def pack(self, values=None) -> bytes:
+        """Packs a tuple of values, one per entry in fields"""
+        values = self._checked(values)
+        if self._single is not None:
+            try:
+                return self._single.pack(*values)
+            except struct.error:
+                return self._single.pack(*self._normalize(values))
+        buf = bytearray(self.nbytes(values))
+        self.pack_into(buf, 0, values)
+        return bytes(buf)
+
+    def pack_into(self, buf, offset=0, values=None) -> int:
+        """Packs a tuple of values into buf, returning the end offset"""
+        values = self._checked(values)
+        try:
+            return self._execute(buf, offset, values)
+        except struct.error:
+            return self._execute(buf, offset, self._normalize(values))
+
+    def _execute(self, buf, offset, values):
+        stack = []
+        marks = {}
+        ref_offsets = [0] * len(self._refs)
+        for step in self._ops:
+            code = step[0]
+            if code == _OP_STRUCT:
+                packer = step[1]
+                if offset + packer.size > len(buf):
+                    raise DFRangeException("Buffer too small for DFPackPlan")
+                packer.pack_into(buf, offset, *values[step[2] : step[3]])
+                offset += packer.size
+            elif code == _OP_BUFFER:
+                offset = _put(buf, offset, values[step[1]], "DFBuffer")
+            elif code == _OP_LENGTH_BEGIN:
+                stack.append(offset)
+                offset = _reserve(buf, offset, step[1])
+            elif code == _OP_LENGTH_END:
+                start = stack.pop()
+                step[1].pack_into(buf, start, (offset - start - step[3]) & step[2])
+            elif code == _OP_MARK_BEGIN:
+                marks[step[1]] = offset
+            elif code == _OP_MARK_END:
+                marks[step[1]] = (marks[step[1]], offset)
+            elif code == _OP_REF:
+                ref_offsets[step[1]] = offset
+                offset = _reserve(buf, offset, step[2])
+            else:
+                offset = _put_array(buf, offset, values[step[1]], step[2], step[3])
+        self._patch(buf, marks, ref_offsets)
+        return offset
+
+    def _patch(self, buf, marks, ref_offsets):
+        """Fills in the reference fields once everything else is packed"""
+        for ref_index, target, func, divisor, packer, mask in self._patches:
+            start, end = marks[target]
+            if func is None:
+                value = (end - start) // divisor
+            else:
+                value = func(buf, start, end)
+            packer.pack_into(buf, ref_offsets[ref_index], value & mask)
+
+
+def _reserve(buf, offset, size) -> int:
+    """Skips a field patched in later, returning the end offset"""
+    if offset + size > len(buf):
+        raise DFRangeException("Buffer too small for DFPackPlan")
+    return offset + size
+
+
+def _put(buf, offset, data, kind) -> int:
+    """Copies data into buf at offset, returning the end offset"""
+    end = offset + len(data)
+    if end > len(buf):
+        raise DFRangeException("Buffer too small for " + kind)
+    buf[offset:end] = data
+    return end
+
+
+def _put_array(buf, offset, data, typecode, swap) -> int:
+    """Copies array values into buf at offset, returning the end offset"""
+    if isinstance(data, memoryview):
+        same = data.format == typecode
+    else:
+        same = isinstance(data, array.array) and data.typecode == typecode
+    if swap or not same:
+        data = array.array(typecode, data)
+        if swap:
+            data.byteswap()
+    with memoryview(data) as view:
+        return _put(buf, offset, view.cast("B"), "DFArray")
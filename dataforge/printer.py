@@ -0,0 +1,56 @@
+"""DataForge streaming pretty printer and hexdump
+"""
+
+from .dataforge import _pack_spans
+from .datatypes import DFBuffer, _read_field
+
+# Byte values as shown in the text column of a hexdump
+_HEXDUMP_TEXT = bytes(b if 32 <= b < 127 else ord(".") for b in range(256))
+
+
+class _Printer:
+    """A tree packed once for the streaming printers
+
+    The (start, end) offsets of every node are recorded in spans, so
+    printing reads lengths and reference fields from the packed bytes
+    instead of measuring or repacking branches.
+    """
+
+    def __init__(self, node, stream, *, offsets=False, width=16, limit=None):
+        self.stream = stream
+        self.offsets = offsets
+        self.width = width
+        self.limit = limit
+        buf, self.spans = _pack_spans(node)
+        self.data = memoryview(buf)
+
+    def line(self, node, text):
+        """Writes one line of the tree, with the offsets of node if enabled"""
+        if self.offsets:
+            start, end = self.spans[id(node)]
+            self.stream.write(f"{start:08x} {end - start:>8} ")
+        self.stream.write(text)
+
+    def field(self, ref):
+        """Packed value of a reference field"""
+        start, end = self.spans[id(ref)]
+        if isinstance(ref._field, DFBuffer):
+            return self.data[start:end].tobytes()
+        return _read_field(ref._field, self.data, start)
+
+    def dump(self, start, end, path):
+        """Writes the hexdump rows of one field"""
+        width = self.width
+        stop = end if self.limit is None else min(end, start + self.limit)
+        offset = start
+        while True:
+            row = self.data[offset : min(offset + width, stop)]
+            text = row.tobytes().translate(_HEXDUMP_TEXT).decode("ascii")
+            line = f"{offset:08x}  {row.hex(' '):<{3 * width - 1}}  {text:<{width}}"
+            self.stream.write(f"{line}  {path}".rstrip() + "\n")
+            path = ""
+            offset += width
+            if offset >= stop:
+                break
+        if stop < end:
+            self.stream.write(f"{'':8}  ... {end - stop} more bytes\n")
@@ -0,0 +1,162 @@
+"""DataForge streaming record decoding
+"""
+import asyncio
+import mmap
+import struct
+import sys
+
+from .datatypes import _UnpackContext
+from .exceptions import DFRangeException, DFTypeException
+from .view import DFView
+
+# Decoding a record against this end shows whether it is self-delimiting
+_UNBOUNDED = sys.maxsize
+
+
+class _RecordSplitter:
+    """Splits buffered data into records described by a schema"""
+
+    def __init__(self, schema, view):
+        self._schema = schema
+        self._view = view
+        self._data = b""
+        self._offset = 0
+        # Bytes known to be missing from the next record
+        self.needed = 0
+
+    def feed(self, chunk):
+        if self._offset >= len(self._data):
+            self._data = chunk
+        else:
+            self._data = memoryview(self._data)[self._offset :].tobytes() + chunk
+        self._offset = 0
+
+    def read_rest(self, readinto):
+        """Reads the rest of the next record straight into place
+
+        The partial record is moved once into a buffer of the full record
+        size, so a record spread over many reads is not copied again for
+        each of them.
+
+        Returns:
+            bool: False if the source ended before the record did
+        """
+        filled = len(self._data) - self._offset
+        buf = bytearray(filled + self.needed)
+        buf[:filled] = memoryview(self._data)[self._offset :]
+        self._data = buf
+        self._offset = 0
+        with memoryview(buf) as view:
+            while filled < len(buf):
+                count = readinto(view[filled:])
+                if not count:
+                    break
+                filled += count
+        if filled < len(buf):
+            del buf[filled:]
+            return False
+        return True
+
+    def records(self):
+        data = memoryview(self._data).cast("B")
+        while self._offset < len(data):
+            spans = {}
+            try:
+                end = self._schema._unpack_from(
+                    data, self._offset, _UNBOUNDED, _UnpackContext(spans)
+                )
+            except struct.error:
+                # A length field is cut off by the end of the chunk
+                self.needed = 0
+                return
+            if end > _UNBOUNDED // 2:
+                raise DFTypeException(
+                    "Schema is not self-delimiting, wrap it in a DFLength"
+                )
+            if end == self._offset:
+                raise DFTypeException("Schema describes empty records")
+            if end > len(data):
+                self.needed = end - len(data)
+                return
+
+            if self._view:
+                yield DFView(self._schema, data, spans)
+            else:
+                self._schema.unpack(data, self._offset)
+                yield self._schema
+            self._offset = end
+        self.needed = 0
+
+    def close(self):
+        if self._offset < len(self._data):
+            raise DFRangeException(
+                f"Truncated record: {len(self._data) - self._offset} bytes left"
+            )
+
+
+def iter_unpack(schema, source, chunk_size=1 << 20, view=False):
+    """Yields the records in a file, socket, mmap or buffer
+
+    Records must be self-delimiting: every variable-size part of the
+    schema has to be bounded by a DFLength or DFLengthRef. Data is read in
+    chunks of chunk_size bytes. Once the size of a record is known, the
+    rest of it is read straight into a buffer of that size when source
+    has readinto() or recv_into(). Memory use stays bounded by the chunk
+    and record size.
+
+    Args:
+        schema (DFContainer): Schema of one record
+        source: bytes-like object or mmap, or an object with read() or
+            recv(), such as a binary file or a socket
+        chunk_size (int): Number of bytes to read at a time
+        view (bool): Yield a DFView per record instead of decoding
+
+    Yields:
+        The schema with the record decoded into it, reused for every
+        record, or a DFView over the record when view is set
+    """
+    splitter = _RecordSplitter(schema, view)
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        splitter.feed(source)
+        yield from splitter.records()
+        splitter.close()
+        return
+
+    read = getattr(source, "read", None) or source.recv
+    readinto = getattr(source, "readinto", None) or getattr(source, "recv_into", None)
+    while True:
+        yield from splitter.records()
+        if splitter.needed and readinto is not None:
+            if not splitter.read_rest(readinto):
+                break
+            continue
+        chunk = read(max(chunk_size, splitter.needed))
+        if not chunk:
+            break
+        splitter.feed(chunk)
+    splitter.close()
+
+
+async def aiter_unpack(schema, reader, chunk_size=1 << 20, view=False):
+    """Asynchronously yields the records read from an asyncio.StreamReader
+
+    Takes the same arguments as iter_unpack, with reader in place of
+    source.
+    """
+    splitter = _RecordSplitter(schema, view)
+    while True:
+        for record in splitter.records():
+            yield record
+        if splitter.needed:
+            # The reader gathers the rest of the record in its own buffer
+            try:
+                chunk = await reader.readexactly(splitter.needed)
+            except asyncio.IncompleteReadError as exc:
+                splitter.feed(exc.partial)
+                break
+        else:
+            chunk = await reader.read(chunk_size)
+            if not chunk:
+                break
+        splitter.feed(chunk)
+    splitter.close()
@@ -0,0 +1,487 @@
+"""DataForge declarative structs
+"""
+import array
+import copy
+import struct
+
+from .dataforge import DFContainer, DFCountRef, DFLengthRef
+from .datatypes import DFArray, DFBasicDataType, DFBuffer, DFUInt8, DFUInt16, DFUInt32
+from .exceptions import DFRangeException, DFTypeException
+
+_SCALARS = (DFUInt8, DFUInt16, DFUInt32)
+
+
+def _array_bytes(values, typecode, swap):
+    """Packed elements of a DFStruct array field"""
+    if swap or not (isinstance(values, array.array) and values.typecode == typecode):
+        values = array.array(typecode, values)
+        if swap:
+            values.byteswap()
+    return values.tobytes()
+
+
+def _array_from(data, typecode, swap):
+    values = array.array(typecode)
+    try:
+        values.frombytes(data)
+    except ValueError as exc:
+        raise DFRangeException(str(exc)) from exc
+    if swap:
+        values.byteswap()
+    return values
+
+
+def _check_end(stop, end):
+    if stop > end:
+        raise DFRangeException("Not enough data for DFStruct field")
+    return stop
+
+
+class _Field:
+    """What code generation needs to know about one declared field"""
+
+    def __init__(self, name, node):
+        self.name = name
+        self.node = node
+        self.ref = None
+        self.target = None
+        if isinstance(node, DFStruct):
+            self.kind = "struct"
+            self.size = type(node)._fixed_size
+        elif isinstance(node, (DFLengthRef, DFCountRef)):
+            self.kind = "ref"
+            self.size = node._field._width
+            self.target = node._ref
+        elif isinstance(node, _SCALARS):
+            self.kind = "scalar"
+            self.size = node._width
+        elif isinstance(node, DFArray):
+            self.kind = "array"
+            self.size = None
+            if node._count is not None:
+                self.size = node._count * node._width
+        elif isinstance(node, DFBuffer):
+            self.kind = "buffer"
+            self.size = None
+        else:
+            raise DFTypeException(
+                f"{name}: {type(node).__name__} cannot be used in a DFStruct"
+            )
+
+    @property
+    def scalar(self):
+        """Scalar packed with the fixed-width runs, if any"""
+        if self.kind == "scalar":
+            return self.node
+        if self.kind == "ref":
+            return self.node._field
+        return None
+
+    def size_expr(self):
+        """Expression for the packed size of a variable-size field"""
+        if self.kind == "buffer":
+            return f"len(self.{self.name})"
+        if self.kind == "array":
+            return f"len(self.{self.name}) * {self.node._width}"
+        return f"self.{self.name}.nbytes"
+
+
+class _Generator:
+    """Writes the source of the methods of a DFStruct class"""
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.by_name = {field.name: field for field in fields}
+        self.namespace = {
+            "DFRangeException": DFRangeException,
+            "_array": array.array,
+            "_array_bytes": _array_bytes,
+            "_array_from": _array_from,
+            "_check_end": _check_end,
+        }
+        for field in fields:
+            if field.kind != "ref":
+                continue
+            target = self.by_name.get(field.target)
+            if target is None or target.kind == "ref":
+                raise DFTypeException(
+                    f"{field.name}: {field.target} is not a field of this DFStruct"
+                )
+            if isinstance(field.node, DFCountRef) and target.kind != "array":
+                raise DFTypeException("DFCountRef must reference a DFArray")
+            target.ref = field
+        self.segments = self._segments()
+
+    def _const(self, prefix, value):
+        name = f"_{prefix}{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def _segments(self):
+        """Groups the fields into struct runs and single variable fields"""
+        segments = []
+        run = []
+        run_endian = None
+        for field in self.fields:
+            scalar = field.scalar
+            if scalar is None:
+                if run:
+                    segments.append(("run", run, run_endian))
+                    run, run_endian = [], None
+                segments.append((field.kind, field, None))
+                continue
+            endian = getattr(scalar, "_endian", None) if scalar._width > 1 else None
+            if endian is not None and run_endian not in (None, endian):
+                segments.append(("run", run, run_endian))
+                run = []
+            if endian is not None:
+                run_endian = endian
+            run.append(field)
+        if run:
+            segments.append(("run", run, run_endian))
+
+        named = []
+        for kind, item, endian in segments:
+            if kind == "run":
+                fmt = (endian or "<") + "".join(f.scalar._fmt for f in item)
+                named.append((kind, item, self._const("s", struct.Struct(fmt))))
+            else:
+                named.append((kind, item, None))
+        return named
+
+    def _ref_value(self, field):
+        """Expression for the value of a length or count field"""
+        target = self.by_name[field.target]
+        if isinstance(field.node, DFCountRef):
+            return f"len(self.{target.name})"
+        if target.kind == "scalar":
+            return str(target.size)
+        if target.kind == "struct" and target.size is not None:
+            return str(target.size)
+        return target.size_expr()
+
+    def _run_values(self, run):
+        values = []
+        for field in run:
+            mask = (1 << (8 * field.scalar._width)) - 1
+            if field.kind == "ref":
+                values.append(f"({self._ref_value(field)}) & {mask:#x}")
+            else:
+                values.append(f"self.{field.name} & {mask:#x}")
+        return ", ".join(values)
+
+    def init(self):
+        args = []
+        body = []
+        for field in self.fields:
+            if field.kind == "ref":
+                continue
+            name = field.name
+            if field.kind in ("scalar", "buffer"):
+                args.append(f"{name}={self._const('d', field.node.value)}")
+                body.append(f"    self.{name} = {name}")
+            elif field.kind == "array":
+                node = field.node
+                default = self._const("d", array.array(node._typecode, node.value))
+                args.append(f"{name}=None")
+                body.append(
+                    f"    self.{name} = _array({default}.typecode,"
+                    f" {default} if {name} is None else {name})"
+                )
+            else:
+                default = self._const("d", field.node)
+                args.append(f"{name}=None")
+                body.append(
+                    f"    self.{name} = {default}._clone() if {name} is None"
+                    f" else {name}"
+                )
+        lines = [f"def __init__(self, {', '.join(['*'] + args) if args else ''}):"]
+        return "\n".join(lines + (body or ["    pass"]))
+
+    def clone(self):
+        lines = [
+            "def _clone(self):",
+            "    new = self.__class__.__new__(self.__class__)",
+        ]
+        for field in self.fields:
+            name = field.name
+            if field.kind in ("scalar", "buffer"):
+                lines.append(f"    new.{name} = self.{name}")
+            elif field.kind == "array":
+                lines.append(
+                    f"    new.{name} = _array(self.{name}.typecode, self.{name})"
+                )
+            elif field.kind == "struct":
+                lines.append(f"    new.{name} = self.{name}._clone()")
+        lines.append("    return new")
+        return "\n".join(lines)
+
+    def nbytes(self):
+        fixed = 0
+        parts = []
+        for field in self.fields:
+            if field.size is not None:
+                fixed += field.size
+            else:
+                parts.append(field.size_expr())
+        return "\n".join(
+            ["def nbytes(self):", f"    return {' + '.join([str(fixed)] + parts)}"]
+        )
+
+    def _variable_value(self, field):
+        if field.kind == "buffer":
+            return f"self.{field.name}"
+        if field.kind == "array":
+            node = field.node
+            return f"_array_bytes(self.{field.name}, {node._typecode!r}, {node._swap})"
+        return f"self.{field.name}.pack()"
+
+    def pack(self):
+        parts = []
+        for kind, item, packer in self.segments:
+            if kind == "run":
+                parts.append(f"{packer}.pack({self._run_values(item)})")
+            else:
+                parts.append(self._variable_value(item))
+        if not parts:
+            body = 'b""'
+        elif len(parts) == 1 and self.segments[0][0] == "run":
+            body = parts[0]
+        else:
+            body = f'b"".join(({", ".join(parts)},))'
+        return f"def pack(self):\n    return {body}"
+
+    def pack_into(self):
+        lines = ["def pack_into(self, buf, offset=0):"]
+        for kind, item, packer in self.segments:
+            if kind == "run":
+                lines.append(
+                    f"    {packer}.pack_into(buf, offset, {self._run_values(item)})"
+                )
+                lines.append(f"    offset += {self.namespace[packer].size}")
+            elif kind == "struct":
+                lines.append(f"    offset = self.{item.name}.pack_into(buf, offset)")
+            else:
+                lines.append(f"    data = {self._variable_value(item)}")
+                lines.append("    end = offset + len(data)")
+                lines.append("    if end > len(buf):")
+                lines.append(
+                    '        raise DFRangeException("Buffer too small for DFStruct")'
+                )
+                lines.append("    buf[offset:end] = data")
+                lines.append("    offset = end")
+        lines.append("    return offset")
+        return "\n".join(lines)
+
+    def _fixed_after(self, index):
+        """Packed size of the fields after a segment, None if variable"""
+        size = 0
+        for kind, item, packer in self.segments[index + 1 :]:
+            if kind == "run":
+                size += self.namespace[packer].size
+            elif item.size is None:
+                return None
+            else:
+                size += item.size
+        return size
+
+    def unpack_from(self):
+        lines = ["def _unpack_from(self, view, offset, end):"]
+        for index, (kind, item, packer) in enumerate(self.segments):
+            if kind == "run":
+                targets = [
+                    f"_{field.name}" if field.kind == "ref" else f"self.{field.name}"
+                    for field in item
+                ]
+                size = self.namespace[packer].size
+                lines.append(f"    _check_end(offset + {size}, end)")
+                lines.append(
+                    f"    {', '.join(targets)}, = {packer}.unpack_from(view, offset)"
+                )
+                lines.append(f"    offset += {size}")
+                continue
+
+            name = item.name
+            if item.size is not None:
+                stop = f"offset + {item.size}"
+            elif item.ref is not None and self._ref_before(item):
+                size = f"_{item.ref.name}"
+                if isinstance(item.ref.node, DFCountRef):
+                    size += f" * {item.node._width}"
+                stop = f"offset + {size}"
+            else:
+                after = self._fixed_after(index)
+                if after is None:
+                    raise DFTypeException(
+                        f"{name} needs a length field before it or only"
+                        " fixed-size fields after it"
+                    )
+                stop = f"end - {after}"
+
+            if kind == "struct":
+                lines.append(
+                    f"    offset = self.{name}._unpack_from(view, offset,"
+                    f" _check_end({stop}, end))"
+                )
+                continue
+            lines.append(f"    stop = _check_end({stop}, end)")
+            if kind == "buffer":
+                lines.append(f"    self.{name} = bytes(view[offset:stop])")
+            else:
+                node = item.node
+                lines.append(
+                    f"    self.{name} = _array_from(view[offset:stop],"
+                    f" {node._typecode!r}, {node._swap})"
+                )
+            lines.append("    offset = stop")
+        lines.append("    return offset")
+        return "\n".join(lines)
+
+    def _ref_before(self, field):
+        return self.fields.index(field.ref) < self.fields.index(field)
+
+    def source(self):
+        return "\n\n".join(
+            [
+                self.init(),
+                self.clone(),
+                self.nbytes(),
+                self.pack(),
+                self.pack_into(),
+                self.unpack_from(),
+            ]
+        )
+
+
+class _DFStructMeta(type):
+    """Turns declared DataForge fields into slots and generated methods"""
+
+    def __new__(mcs, name, bases, namespace):
+        inherited = []
+        for base in reversed(bases):
+            inherited.extend(getattr(base, "_df_fields", ()))
+        declared = [
+            _Field(key, value)
+            for key, value in namespace.items()
+            if isinstance(value, DFBasicDataType)
+            or isinstance(type(value), _DFStructMeta)
+        ]
+        for field in declared:
+            del namespace[field.name]
+        namespace["__slots__"] = tuple(
+            field.name for field in declared if field.kind != "ref"
+        )
+        cls = super().__new__(mcs, name, bases, namespace)
+        fields = inherited + declared
+        cls._df_fields = tuple(fields)
+        if not fields:
+            return cls
+
+        generator = _Generator(fields)
+        source = generator.source()
+        code = compile(source, f"<DFStruct {cls.__qualname__}>", "exec")
+        exec(code, generator.namespace)  # pylint: disable=exec-used
+        for method in ("__init__", "_clone", "pack", "pack_into", "_unpack_from"):
+            setattr(cls, method, generator.namespace[method])
+        cls.nbytes = property(generator.namespace["nbytes"])
+        cls._source = source
+        cls._fixed_size = None
+        if all(field.size is not None for field in fields):
+            cls._fixed_size = sum(field.size for field in fields)
+        return cls
+
+
+class DFStruct(metaclass=_DFStructMeta):
+    """Declarative fixed-layout record with generated pack and unpack code
+
+    Fields are declared as class attributes, in wire order:
+
+        class Header(DFStruct):
+            magic = DFUInt32(endian=DFEndian.BIG, value=0xFEEDFACE)
+            length = DFLengthRef(DFUInt16(), "payload")
+            payload = DFBuffer()
+
+    When the class is created, straight-line pack, pack_into, unpack and
+    nbytes code is generated for the layout, with runs of scalars packed by
+    one struct.Struct. Instances only hold values: scalars as ints,
+    buffers as bytes, arrays as array.array and nested DFStruct fields as
+    instances. Length and count references to fields of the same struct
+    are computed on pack and are not stored.
+
+    Supported fields are the integer types, DFBuffer, DFArray, DFLengthRef,
+    DFCountRef and nested DFStruct instances. Values are keyword arguments
+    to the constructor, defaulting to the declared values.
+    """
+
+    __slots__ = ()
+    _df_fields = ()
+    _fixed_size = 0
+
+    # Replaced by generated code in structs that declare fields
+    def pack(self) -> bytes:
+        """Returns the packed bytes of this struct's values"""
+        return b""
+
+    def pack_into(self, buf, offset=0) -> int:
+        """Packs into a writable buffer at offset, returning the end offset"""
+        return _check_end(offset, len(buf))
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the packed data"""
+        return 0
+
+    def _unpack_from(self, _view, offset, end):
+        return _check_end(offset, end)
+
+    def unpack(self, buffer, offset=0):
+        """Decodes packed data from buffer into this struct's values
+
+        Args:
+            buffer: bytes, bytearray, memoryview, mmap or other buffer
+            offset (int): Position in buffer to start decoding at
+
+        Returns:
+            int: Offset just past the decoded data
+        """
+        with memoryview(buffer) as view:
+            with view.cast("B") as data:
+                return self._unpack_from(data, offset, len(data))
+
+    def to_container(self) -> DFContainer:
+        """Returns a DFContainer tree holding the same fields and values"""
+        container = DFContainer()
+        self._fill(container, "")
+        return container
+
+    def _fill(self, container, prefix):
+        for field in self._df_fields:
+            if field.kind == "struct":
+                child = DFContainer()
+                container.add(field.name, child)
+                getattr(self, field.name)._fill(child, prefix + field.name + ".")
+            elif field.kind == "ref":
+                node = copy.deepcopy(field.node)
+                node._ref = prefix + field.target
+                container.add(field.name, node)
+            else:
+                node = copy.deepcopy(field.node)
+                node.value = getattr(self, field.name)
+                container.add(field.name, node)
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(
+            getattr(self, field.name) == getattr(other, field.name)
+            for field in self._df_fields
+            if field.kind != "ref"
+        )
+
+    def __repr__(self):
+        values = ", ".join(
+            f"{field.name}={getattr(self, field.name)!r}"
+            for field in self._df_fields
+            if field.kind != "ref"
+        )
+        return f"{type(self).__name__}({values})"
@@ -0,0 +1,126 @@
+"""DataForge lazy views over packed data
+"""
+
+import copy
+
+from .dataforge import DFCallableRef, DFContainer, DFLength, DFLengthRef
+from .datatypes import DFArray, DFBuffer, _read_field
+from .exceptions import DFTypeException
+
+
+class DFView:
+    """Lazy, read-only view of packed data through a container schema
+
+    Created by DFContainer.view. Children are reached with the same
+    attribute syntax as the schema: scalars and reference fields are
+    decoded on access, DFBuffer payloads are returned as memoryview
+    slices and containers as nested views.
+    """
+
+    def __init__(self, node, data, spans):
+        self._node = node
+        self._data = data
+        self._spans = spans
+
+    def __getattr__(self, name):
+        node = self._node
+        if isinstance(node, DFLength):
+            node = node._children["_data"]
+        try:
+            child = node._children[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+        start, end = self._spans[id(child)]
+        if isinstance(child, (DFLengthRef, DFCallableRef)):
+            # Reference fields read as the field they hold
+            child = child._field
+        elif isinstance(child, DFContainer):
+            return type(self)(child, self._data, self._spans)
+        if isinstance(child, DFBuffer):
+            return self._data[start:end]
+        if isinstance(child, DFArray):
+            if child._swap or (end - start) % child._width:
+                return child._decode(self._data[start:end])
+            return self._data[start:end].cast(child._typecode)
+        return _read_field(child, self._data, start)
+
+    @property
+    def _span(self):
+        return self._spans[id(self._node)]
+
+    def __len__(self):
+        start, end = self._span
+        return end - start
+
+    def tobytes(self) -> bytes:
+        """Returns a copy of the packed bytes covered by this view"""
+        start, end = self._span
+        return self._data[start:end].tobytes()
+
+    def __repr__(self):
+        start, end = self._span
+        return f"<{type(self).__name__} {self._node._name} [{start}:{end}]>"
+
+
+class DFFrozen(DFView):
+    """Immutable snapshot of a container tree
+
+    Created by DFContainer.freeze. Children are reached as on a DFView.
+    Nothing is computed or changed after the snapshot is made, so one
+    snapshot can be read from many threads. Snapshots hash and compare by
+    their packed bytes.
+    """
+
+    def __init__(self, node, data, spans, packed=None):
+        # pylint: disable=super-init-not-called
+        object.__setattr__(self, "_node", node)
+        object.__setattr__(self, "_data", data)
+        object.__setattr__(self, "_spans", spans)
+        object.__setattr__(self, "_packed", packed)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def pack(self) -> bytes:
+        """Returns the packed bytes, without copying for a whole tree"""
+        if self._packed is None:
+            return self.tobytes()
+        return self._packed
+
+    @property
+    def nbytes(self) -> int:
+        return len(self)
+
+    def thaw(self) -> "DFContainer":
+        """Returns a mutable copy of the tree the snapshot was made from
+
+        Raises:
+            DFTypeException: A reference in the snapshot points at a node
+                outside it, which the copy cannot follow
+        """
+        node = copy.deepcopy(self._node)
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if isinstance(current, (DFLengthRef, DFCallableRef)):
+                try:
+                    current._get_root(current)._lookup(current._ref)
+                except (KeyError, AttributeError):
+                    raise DFTypeException(
+                        f"{current._ref} is outside the frozen tree"
+                    ) from None
+            elif isinstance(current, DFContainer):
+                stack.extend(current._children.values())
+        return node
+
+    def __hash__(self):
+        return hash(self.pack())
+
+    def __eq__(self, other):
+        if not isinstance(other, DFFrozen):
+            return NotImplemented
+        return self.pack() == other.pack()
@@ -1,13 +1,23 @@
-# pylint: disable=too-few-public-methods
+# pylint: disable=too-few-public-methods,too-many-lines
 """DataForge test suite
 """
+import array
+import asyncio
+import concurrent.futures
+import hashlib
+import io
+import mmap
+import os
+import socket
+import zlib
+
 import pytest
 
 from dataforge import *  # pylint: disable=W0401,W0614
-from dataforge.exceptions import DFRangeException
+from dataforge.exceptions import DFRangeException, DFTypeException
 
 
-class TestDFUInt8():
+class TestDFUInt8:
     """Test unsigned int 8-bit"""
 
     def test(self):
@@ -27,7 +37,7 @@ class TestDFUInt8():
         assert df_test.length == 1
 
 
-class TestDFSInt8():
+class TestDFSInt8:
     """Test signed int 8-bit"""
 
     def test(self):
@@ -47,7 +57,7 @@ class TestDFSInt8():
         assert df_test.length == 1
 
 
-class TestDFUInt16():
+class TestDFUInt16:
     """Test unsigned int 16-bit"""
 
     def test(self):
@@ -76,7 +86,7 @@ class TestDFUInt16():
         assert df_test.length == 2
 
 
-class TestDFSInt16():
+class TestDFSInt16:
     """Test signed int 16-bit"""
 
     def test(self):
@@ -102,7 +112,7 @@ class TestDFSInt16():
         assert df_test.length == 2
 
 
-class TestDFUInt32():
+class TestDFUInt32:
     """Test unsigned int 32-bit"""
 
     def test(self):
@@ -128,7 +138,7 @@ class TestDFUInt32():
         assert df_test.length == 4
 
 
-class TestDFSInt32():
+class TestDFSInt32:
     """Test signed int 32-bit"""
 
     def test(self):
@@ -140,7 +150,7 @@ class TestDFSInt32():
         assert b"\xfb\xff\xff\xff" == df_test.pack()
 
 
-class TestDFContainer():
+class TestDFContainer:
     """Test Container"""
 
     def test(self):
@@ -180,7 +190,7 @@ class TestDFContainer():
         df_test.sub.test_sub.sub_sub.deep_value = DFUInt32(value=0xEEFF)
 
 
-class TestDFContainerShorthand():
+class TestDFContainerShorthand:
     """Test Container shorthand syntax"""
 
     def test(self):
@@ -220,7 +230,7 @@ class TestDFContainerShorthand():
         df_test.add("sub.test.sub_sub.deep_value", DFUInt32(value=0xEEFF))
 
 
-class TestDFLength():
+class TestDFLength:
     """Test length-counted container"""
 
     def test(self):
@@ -236,8 +246,18 @@ class TestDFLength():
         df_test.len.data2 = DFUInt8(value=10)
         assert b"\x00\x05\xdd\xcc\xbb\xaa\x0a" == df_test.pack()
 
+        # References inside the data resolve from the data container
+        df_test = DFContainer()
+        df_test.body = DFLength(DFUInt16(), DFContainer())
+        df_test.body.len = DFLengthRef(DFUInt8(), "payload")
+        df_test.body.payload = DFBuffer(value=b"abcd")
+        assert b"\x05\x00\x04abcd" == df_test.pack()
+        df_test.incremental = True
+        df_test.body.payload.value = b"ab"
+        assert b"\x03\x00\x02ab" == df_test.pack()
+
 
-class TestDFLengthRef():
+class TestDFLengthRef:
     """Test length-counted container"""
 
     def test(self):
@@ -269,12 +289,1187 @@ class TestDFLengthRef():
         df_test.sub1.sub2.len_data.data2 = DFUInt8(value=10)
         # print(df_test.pretty_print())
         # print(df_test.pack())
-        assert(
+        assert (
             b"\x11\x07\x00\x05\x00\x09\x00\x00\x00\xdd\xcc\xbb\xaa\x0a"
             == df_test.pack()
         )
 
 
+class TestDFContainerWide:
+    """Test packing of wide and nested containers"""
+
+    def test(self):
+        df_test = DFContainer()
+        for i in range(10000):
+            df_test.add(f"f{i}", DFUInt16(value=i))
+        expected = b"".join(i.to_bytes(2, "little") for i in range(10000))
+        assert expected == df_test.pack()
+
+        df_test = DFContainer()
+        df_test.outer = DFLength(DFUInt16(), DFContainer())
+        df_test.outer.head = DFUInt8(value=1)
+        df_test.outer.inner = DFLength(DFUInt8(), DFContainer())
+        df_test.outer.inner.buf = DFBuffer(value=b"A" * 300)
+        df_test.outer.tail = DFUInt8(value=2)
+        assert b"\x2f\x01\x01" + b"\x2c" + b"A" * 300 + b"\x02" == df_test.pack()
+
+
+class TestPackInto:
+    """Test packing into caller-owned buffers"""
+
+    def test(self):
+        df_test = DFContainer()
+        df_test.magic = DFUInt16(value=0xAABB, endian=DFEndian.BIG)
+        df_test.len = DFLengthRef(DFUInt8(), "body")
+        df_test.body = DFLength(DFUInt16(), DFContainer())
+        df_test.body.data = DFUInt32(value=0x11223344)
+        df_test.body.buf = DFBuffer(value=b"xyz")
+        expected = df_test.pack()
+
+        buf = bytearray(len(expected) + 4)
+        assert df_test.pack_into(buf, 2) == len(expected) + 2
+        assert bytes(buf) == b"\x00\x00" + expected + b"\x00\x00"
+
+        view = memoryview(bytearray(len(expected)))
+        assert df_test.pack_into(view) == len(expected)
+        assert view.tobytes() == expected
+
+        assert DFUInt8(value=7).pack_into(buf, 0) == 1
+        assert buf[0] == 7
+
+        with pytest.raises(DFRangeException):
+            DFBuffer(value=b"abcd").pack_into(bytearray(3))
+        with pytest.raises(DFRangeException):
+            DFUInt32().pack_into(bytearray(2))
+        with pytest.raises(DFRangeException):
+            DFSInt16().pack_into(bytearray(2), 1)
+        with pytest.raises(DFRangeException):
+            df_test.pack_into(bytearray(len(expected) - 1))
+
+
+class TestNBytes:
+    """Test static size computation"""
+
+    def test(self):
+        assert DFUInt8().nbytes == 1
+        assert DFSInt16().nbytes == 2
+        assert DFUInt32().nbytes == 4
+        df_buf = DFBuffer(value=b"ab")
+        df_buf.value = b"abcdef"
+        assert df_buf.nbytes == 6
+        assert df_buf.length == 6
+
+        df_test = DFContainer()
+        df_test.len = DFLengthRef(DFUInt16(), "body")
+        df_test.crc = DFCallableRef(DFUInt32(), csum, "body")
+        df_test.body = DFLength(DFUInt16(), DFContainer())
+        df_test.body.data = DFUInt32(value=0x11223344)
+        df_test.body.buf = DFBuffer(value=b"xyz")
+        assert df_test.len.value == 9
+        assert df_test.body.value == 7
+        assert df_test.nbytes == len(df_test.pack()) == 15
+        assert df_test.length == 15
+
+
+def build_message():
+    df_test = DFContainer()
+    df_test.seq = DFUInt32(value=1)
+    df_test.len = DFLengthRef(DFUInt16(), "body")
+    df_test.crc = DFCallableRef(DFUInt16(), csum, "body")
+    df_test.body = DFLength(DFUInt16(), DFContainer())
+    df_test.body.head = DFUInt8(value=2)
+    df_test.body.buf = DFBuffer(value=b"abc")
+    df_test.other = DFContainer()
+    df_test.other.count = DFUInt16(value=3)
+    return df_test
+
+
+class TestIncremental:
+    """Test dirty-tracking packed-bytes cache"""
+
+    def test(self):
+        df_test = build_message()
+        df_test.incremental = True
+        assert build_message().pack() == df_test.pack()
+
+        # Clean subtrees keep their cached bytes
+        other_cache = df_test.other._cache
+        df_test.seq.value = 2
+        assert df_test.other._cache is other_cache
+        assert df_test._cache is None
+
+        # Changes in a referenced branch update the dependent fields
+        df_test.body.buf.value = b"abcdefg"
+        df_test.body.tail = DFUInt8(value=4)
+        df_test.other.extra = DFContainer()
+        df_test.other.extra.count = DFUInt8(value=5)
+
+        expected = build_message()
+        expected.seq.value = 2
+        expected.body.buf.value = b"abcdefg"
+        expected.body.tail = DFUInt8(value=4)
+        expected.other.extra = DFContainer()
+        expected.other.extra.count = DFUInt8(value=5)
+        assert expected.pack() == df_test.pack()
+        assert expected.nbytes == df_test.nbytes
+
+        buf = bytearray(df_test.nbytes)
+        df_test.pack_into(buf)
+        assert expected.pack() == bytes(buf)
+        with pytest.raises(DFRangeException):
+            df_test.pack_into(bytearray(3), 2)
+
+        df_test.incremental = False
+        df_test.body.head.value = 9
+        expected.body.head.value = 9
+        assert expected.pack() == df_test.pack()
+
+
+class TestCompile:
+    """Test precompiled pack plans"""
+
+    def test(self):
+        df_test = build_message()
+        df_test.body.inner = DFContainer()
+        df_test.body.inner.big = DFUInt16(value=0x1122, endian=DFEndian.BIG)
+        df_test.body.inner_sum = DFCallableRef(DFUInt8(), csum, "inner")
+        plan = df_test.compile()
+        assert plan.fields == (
+            "seq",
+            "body.head",
+            "body.buf",
+            "body.inner.big",
+            "other.count",
+        )
+        assert plan.pack() == df_test.pack()
+        assert plan.nbytes() == df_test.nbytes
+
+        values = (0x105, b"\x09", b"longer buffer", 0xAABB, -1)
+        df_test.seq.value = 0x105
+        df_test.body.head.value = b"\x09"
+        df_test.body.buf.value = b"longer buffer"
+        df_test.body.inner.big.value = 0xAABB
+        df_test.other.count.value = -1
+        assert plan.pack(values) == df_test.pack()
+
+        buf = bytearray(plan.nbytes(values) + 1)
+        assert plan.pack_into(buf, 1, values) == len(buf)
+        assert bytes(buf[1:]) == df_test.pack()
+        for size in (1, 4, len(buf) - 2):
+            with pytest.raises(DFRangeException):
+                plan.pack_into(bytearray(size), 0, values)
+
+        df_test = DFContainer()
+        df_test.first = DFUInt8(value=1)
+        df_test.second = DFUInt16(value=2, endian=DFEndian.BIG)
+        df_test.third = DFUInt32(value=3)
+        plan = df_test.compile()
+        assert plan.pack((4, 5, 6)) == b"\x04\x00\x05\x06\x00\x00\x00"
+
+        with pytest.raises(DFRangeException):
+            plan.pack((1, 2))
+        with pytest.raises(DFRangeException):
+            plan.pack((1, 2, 3, 4))
+        with pytest.raises(DFRangeException):
+            plan.nbytes((1, 2))
+
+        df_test = DFContainer()
+        df_test.len = DFLengthRef(DFUInt8(), "data")
+        df_test.data = DFContainer()
+        with pytest.raises(DFTypeException):
+            df_test.len.compile()
+
+
+class TestUnpack:
+    """Test decoding packed data back into a tree"""
+
+    def test(self):
+        df_test = DFUInt16(endian=DFEndian.BIG)
+        assert df_test.unpack(b"\x12\x34") == 2
+        assert df_test.value == 0x1234
+
+        df_test = DFUInt32()
+        assert df_test.unpack(bytearray(b"\x00\x78\x56\x34\x12"), 1) == 5
+        assert df_test.value == 0x12345678
+
+        with pytest.raises(DFRangeException):
+            DFUInt32().unpack(b"\x00\x00")
+
+        expected = build_message()
+        expected.seq.value = 0xDEADBEEF
+        expected.body.buf.value = b"hello world"
+        expected.other.count.value = 0x4242
+        data = expected.pack()
+
+        df_test = build_message()
+        assert df_test.unpack(memoryview(data)) == len(data)
+        assert df_test.seq.value == 0xDEADBEEF
+        assert df_test.body.buf.value == b"hello world"
+        assert df_test.other.count.value == 0x4242
+        assert df_test.pack() == data
+
+        # Buffers sized by a DFLengthRef, and by the fixed fields after them
+        df_test = DFContainer()
+        df_test.len = DFLengthRef(DFUInt8(), "first")
+        df_test.first = DFBuffer()
+        df_test.second = DFBuffer()
+        df_test.tail = DFUInt16()
+        assert df_test.unpack(b"\x03abcdefg\x01\x00") == 10
+        assert df_test.first.value == b"abc"
+        assert df_test.second.value == b"defg"
+        assert df_test.tail.value == 1
+
+        df_test = DFContainer()
+        df_test.len = DFLength(DFUInt8(), DFContainer())
+        df_test.len.data = DFBuffer()
+        with pytest.raises(DFRangeException):
+            df_test.unpack(b"\x05abc")
+
+
+class TestView:
+    """Test lazy views over packed data"""
+
+    def test(self):
+        expected = build_message()
+        expected.seq.value = 0xDEADBEEF
+        expected.body.buf.value = b"hello world"
+        expected.other.count.value = 0x4242
+        data = expected.pack()
+
+        schema = build_message()
+        view = schema.view(data)
+        assert view.seq == 0xDEADBEEF
+        assert view.len == 14
+        assert view.body.head == 2
+        assert isinstance(view.body.buf, memoryview)
+        assert view.body.buf == b"hello world"
+        assert view.other.count == 0x4242
+        assert view.tobytes() == data
+        assert len(view.body) == 14
+        # Nothing was decoded into the schema
+        assert schema.seq.value == 1
+        assert schema.body.buf.value == b"abc"
+
+        with pytest.raises(AttributeError):
+            view.missing  # pylint: disable=pointless-statement
+
+        with pytest.raises(DFRangeException):
+            schema.view(data[:-1])
+
+
+def build_record():
+    df_test = DFLength(DFUInt16(), DFContainer())
+    df_test.seq = DFUInt32()
+    df_test.payload = DFBuffer()
+    return df_test
+
+
+class TestIterUnpack:
+    """Test streaming record decoding"""
+
+    def test(self):
+        record = build_record()
+        data = b""
+        for i in range(200):
+            record.seq.value = i
+            record.payload.value = bytes([i]) * (i % 37)
+            data += record.pack()
+
+        schema = build_record()
+        seen = []
+        for rec in iter_unpack(schema, io.BytesIO(data), chunk_size=7):
+            assert rec is schema
+            seen.append((rec.seq.value, rec.payload.value))
+        assert seen == [(i, bytes([i]) * (i % 37)) for i in range(200)]
+
+        views = list(iter_unpack(build_record(), data, view=True))
+        assert [v.seq for v in views] == list(range(200))
+        assert views[5].payload == b"\x05" * 5
+
+        # The rest of a record is received straight into its own buffer
+        left, right = socket.socketpair()
+        with left, right:
+            left.sendall(data)
+            left.shutdown(socket.SHUT_WR)
+            views = list(iter_unpack(build_record(), right, chunk_size=16, view=True))
+        assert [bytes(v.payload) for v in views] == [
+            bytes([i]) * (i % 37) for i in range(200)
+        ]
+
+        async def collect():
+            reader = asyncio.StreamReader()
+            reader.feed_data(data)
+            reader.feed_eof()
+            return [
+                rec.seq
+                async for rec in aiter_unpack(
+                    build_record(), reader, chunk_size=64, view=True
+                )
+            ]
+
+        assert asyncio.run(collect()) == list(range(200))
+
+        with pytest.raises(DFRangeException):
+            list(iter_unpack(build_record(), io.BytesIO(data[:-1])))
+
+        df_test = DFContainer()
+        df_test.payload = DFBuffer()
+        with pytest.raises(DFTypeException):
+            list(iter_unpack(df_test, b"abc"))
+
+
+class TestDFArray:
+    """Test array-backed repeated fields"""
+
+    def test(self):
+        df_test = DFArray(DFUInt16, value=[1, 0x1234])
+        assert b"\x01\x00\x34\x12" == df_test.pack()
+        assert df_test.nbytes == 4
+        assert df_test.count == 2
+
+        df_test = DFArray(DFUInt16, endian=DFEndian.BIG, value=[1, 0x1234])
+        assert b"\x00\x01\x12\x34" == df_test.pack()
+        assert list(df_test.value) == [1, 0x1234]
+
+        df_test = DFArray(DFSInt32, count=2)
+        assert b"\x00" * 8 == df_test.pack()
+        df_test.value = array.array("i", [-1, 2])
+        assert b"\xff\xff\xff\xff\x02\x00\x00\x00" == df_test.pack()
+        with pytest.raises(DFRangeException):
+            df_test.value = [1, 2, 3]
+        with pytest.raises(DFRangeException):
+            DFArray(DFUInt8, value=[256])
+        with pytest.raises(DFTypeException):
+            DFArray(DFBuffer)
+
+        # Count-prefixed and byte-prefixed arrays
+        df_test = DFContainer()
+        df_test.count = DFCountRef(DFUInt8(), "items")
+        df_test.items = DFArray(DFUInt16, endian=DFEndian.BIG, value=range(5))
+        df_test.body = DFLength(DFUInt16(), DFContainer())
+        df_test.body.bytes = DFArray(DFUInt8, value=b"abc")
+        df_test.tail = DFUInt8(value=9)
+        data = df_test.pack()
+        assert data == (
+            b"\x05\x00\x00\x00\x01\x00\x02\x00\x03\x00\x04" + b"\x03\x00abc\x09"
+        )
+        assert df_test.compile().pack() == data
+
+        schema = DFContainer()
+        schema.count = DFCountRef(DFUInt8(), "items")
+        schema.items = DFArray(DFUInt16, endian=DFEndian.BIG)
+        schema.body = DFLength(DFUInt16(), DFContainer())
+        schema.body.bytes = DFArray(DFUInt8)
+        schema.tail = DFUInt8()
+        view = schema.view(data)
+        assert list(view.items) == [0, 1, 2, 3, 4]
+        assert bytes(view.body.bytes) == b"abc"
+        assert schema.unpack(data) == len(data)
+        assert list(schema.items.value) == [0, 1, 2, 3, 4]
+        assert schema.body.bytes.value.tobytes() == b"abc"
+        assert schema.tail.value == 9
+
+    def test_elements(self):
+        # Element changes reach incremental containers
+        df_test = DFContainer()
+        df_test.values = DFArray(DFUInt8, value=[1, 2])
+        df_test.incremental = True
+        assert df_test.pack() == b"\x01\x02"
+        with pytest.raises(TypeError):
+            df_test.values.value[0] = 9
+        df_test.values[0] = 9
+        assert df_test.values[0] == 9
+        assert df_test.pack() == b"\x09\x02"
+        df_test.values[1:] = [3, 4]
+        assert df_test.pack() == b"\x09\x03\x04"
+        with pytest.raises(DFRangeException):
+            df_test.values[0] = 256
+        with pytest.raises(DFRangeException):
+            DFArray(DFUInt8, count=2)[:] = [1, 2, 3]
+
+
+class TestPackBatch:
+    """Test columnar batch packing"""
+
+    def test(self):
+        schema = build_message()
+        columns = {
+            "seq": list(range(50)),
+            "body.buf": [b"x" * (i % 7) for i in range(50)],
+        }
+        buf, offsets = pack_batch(schema, columns)
+        assert len(offsets) == 51
+
+        expected = []
+        for i in range(50):
+            schema.seq.value = i
+            schema.body.buf.value = b"x" * (i % 7)
+            expected.append(schema.pack())
+        records = [bytes(buf[offsets[i] : offsets[i + 1]]) for i in range(50)]
+        assert records == expected
+        assert list(iter_pack_batch(schema.compile(), columns)) == expected
+
+        schema = DFContainer()
+        schema.first = DFUInt8()
+        schema.second = DFUInt16(value=7)
+        schema.third = DFUInt32(endian=DFEndian.BIG)
+        columns = {"first": array.array("B", range(256)) * 10, "third": range(2560)}
+        buf, offsets = pack_batch(schema, columns)
+        assert offsets[1] == 7 and len(buf) == 7 * 2560
+        assert bytes(buf[21:28]) == b"\x03\x07\x00\x00\x00\x00\x03"
+
+        # Values wider than their field are truncated like the setters do
+        buf, _ = pack_batch(schema, {"first": [0x101]})
+        assert bytes(buf) == b"\x01\x07\x00\x00\x00\x00\x00"
+
+        buf, _ = pack_batch(schema, {}, count=2)
+        assert bytes(buf) == schema.pack() * 2
+
+        with pytest.raises(DFRangeException):
+            pack_batch(schema, {"first": [1], "third": [1, 2]})
+        with pytest.raises(DFTypeException):
+            pack_batch(schema, {"nope": [1]})
+
+
+class TestSlots:
+    """Test compact scalar representation"""
+
+    def test(self):
+        for df_type in (DFUInt8, DFSInt8, DFUInt16, DFSInt16, DFUInt32, DFSInt32):
+            df_test = df_type(value=1)
+            assert not hasattr(df_test, "__dict__")
+            assert df_test.length == df_type._width
+        assert not hasattr(DFBuffer(), "__dict__")
+        assert not hasattr(DFArray(), "__dict__")
+        assert DFSInt16(value=-2, endian=DFEndian.BIG).pack() == b"\xff\xfe"
+
+
+class TestAttributeAccess:
+    """Test child access through attributes"""
+
+    def test(self):
+        df_test = DFContainer()
+        df_test.child = DFUInt8(value=1)
+        first = df_test.child
+        df_test.child = DFUInt8(value=2)
+        assert df_test.child is not first
+        assert df_test.child.value == 2
+
+        df_test.add("sub", DFContainer())
+        df_test.add("sub.leaf", DFUInt16(value=3))
+        assert df_test.sub.leaf.value == 3
+
+        df_test.body = DFLength(DFUInt8(), DFContainer())
+        df_test.body.leaf = DFUInt8(value=4)
+        df_test.body._children["_data"].add("direct", DFUInt8(value=5))
+        assert df_test.body.leaf.value == 4
+        assert df_test.body.direct.value == 5
+        assert df_test.pack() == b"\x02\x03\x00\x02\x04\x05"
+
+        with pytest.raises(AttributeError):
+            df_test.missing  # pylint: disable=pointless-statement
+        with pytest.raises(AttributeError):
+            df_test.body.missing  # pylint: disable=pointless-statement
+
+        # Children named like container properties take their place
+        df_names = DFContainer()
+        df_names.body = DFContainer()
+        df_names.body.payload = DFBuffer(b"abc")
+        df_names.length = DFLengthRef(DFUInt8(), "body")
+        df_names.name = DFUInt8(value=7)
+        df_names.frame = DFLength(DFUInt8(), DFContainer())
+        df_names.frame.value = DFUInt8(value=8)
+        assert df_names.length.value == 3
+        assert df_names.name.value == 7
+        assert df_names.frame.value.value == 8
+        assert df_names.nbytes == 7
+        assert df_names.pack() == b"abc\x03\x07\x01\x08"
+        with pytest.raises(DFTypeException):
+            df_names.nbytes = DFUInt8()
+
+        # Plain values assigned to a child's name set the child's value
+        child = df_test.child
+        df_test.child = 9
+        df_test.body.leaf = 6
+        df_names.name = 5
+        assert df_test.child is child
+        assert df_test.child.value == 9
+        assert df_test.body.leaf.value == 6
+        assert df_test.pack() == b"\x09\x03\x00\x02\x06\x05"
+        assert df_names.name.value == 5
+        df_test.incremental = True
+        df_test.child = 1
+        assert df_test.pack()[:1] == b"\x01"
+        with pytest.raises(DFTypeException):
+            df_test.child = "x"
+
+
+class TestResolvedRefs:
+    """Test that referenced branches are packed once per pack"""
+
+    def test(self):
+        calls = []
+
+        def counted(data: bytes) -> int:
+            calls.append(data)
+            return csum(data)
+
+        df_test = DFContainer()
+        df_test.len = DFLengthRef(DFUInt16(), "body")
+        df_test.crc = DFCallableRef(DFUInt16(), counted, "body")
+        df_test.outer = DFCallableRef(DFUInt16(), counted, "body")
+        df_test.body = DFContainer()
+        df_test.body.inner = DFCallableRef(DFUInt8(), counted, "body.payload")
+        df_test.body.payload = DFBuffer(value=b"abc")
+        data = df_test.pack()
+        assert data[:2] == b"\x04\x00"
+        assert data[6:] == b"\x26abc"
+        assert csum(b"\x26abc").to_bytes(2, "little") * 2 == data[2:6]
+        # The inner checksum is patched before the two covering it
+        assert calls == [b"abc", b"\x26abc", b"\x26abc"]
+
+        # Structure changes are seen by cached resolutions
+        calls.clear()
+        df_test.body.payload = DFBuffer(value=b"abcd")
+        assert df_test.pack()[:2] == b"\x05\x00"
+        assert len(calls) == 3
+
+        buf = bytearray(df_test.nbytes + 1)
+        assert df_test.pack_into(buf, 1) == len(buf)
+        assert bytes(buf[1:]) == df_test.pack()
+
+        df_test.incremental = True
+        df_test.body.payload.value = b"xyz"
+        assert df_test.pack()[6:] == b"\x6bxyz"
+        df_test.incremental = False
+        assert df_test.pack()[6:] == b"\x6bxyz"
+
+        # Building or changing other trees keeps this one's resolutions
+        resolved = (df_test.len._resolved, df_test.body.inner._resolved)
+        index = df_test._index
+        other = build_message()
+        other.body.extra = DFLength(DFUInt8(), DFContainer())
+        other.body.extra.incremental = True
+        assert df_test.pack()[6:] == b"\x6bxyz"
+        assert (df_test.len._resolved, df_test.body.inner._resolved) == resolved
+        assert df_test.len._resolved[1] is df_test.body
+        assert df_test._index is index
+
+        # Moving a branch out of this tree changes its structure
+        other.payload = df_test.body.payload
+        assert df_test._index is index
+        df_test.pack()
+        assert df_test._index is not index
+
+
+class TestDFDigestRef:
+    """Test running checksum and hash references"""
+
+    def test(self):
+        df_test = DFContainer()
+        df_test.crc = DFDigestRef(DFUInt32(), zlib.crc32, "body")
+        df_test.adler = DFDigestRef(DFUInt32(), zlib.adler32, "body")
+        df_test.sum = DFDigestRef(
+            DFUInt16(), lambda data, value: value + csum(data), "body", initial=0
+        )
+        df_test.sha = DFDigestRef(DFBuffer(), hashlib.sha256(), "body")
+        df_test.body = DFLength(DFUInt32(), DFContainer())
+        df_test.body.head = DFUInt8(value=2)
+        df_test.body.payload = DFBuffer(value=b"abc" * 1000)
+
+        body = df_test.body.pack()
+        assert df_test.crc.value == zlib.crc32(body)
+        assert df_test.adler.value == zlib.adler32(body)
+        assert df_test.sum.value == csum(body) & 0xFFFF
+        assert df_test.sha.value == hashlib.sha256(body).digest()
+        assert df_test.nbytes == 4 + 4 + 2 + 32 + len(body)
+
+        data = df_test.pack()
+        assert data == (
+            zlib.crc32(body).to_bytes(4, "little")
+            + zlib.adler32(body).to_bytes(4, "little")
+            + (csum(body) & 0xFFFF).to_bytes(2, "little")
+            + hashlib.sha256(body).digest()
+            + body
+        )
+
+        # Spans larger than a chunk are fed in pieces
+        df_test.body.payload.value = bytes(range(256)) * 5000
+        body = df_test.body.pack()
+        data = df_test.pack()
+        assert data[:4] == zlib.crc32(body).to_bytes(4, "little")
+        assert data[10:42] == hashlib.sha256(body).digest()
+
+        view = df_test.view(data)
+        assert view.crc == zlib.crc32(body)
+        assert bytes(view.sha) == hashlib.sha256(body).digest()
+        assert len(view.body.payload) == 256 * 5000
+
+        # Integer fields take the big-endian digest
+        df_test = DFContainer()
+        df_test.md5 = DFDigestRef(DFUInt32(), hashlib.md5(), "body")
+        df_test.body = DFContainer()
+        df_test.body.value = DFUInt8(value=1)
+        digest = hashlib.md5(b"\x01").digest()
+        assert df_test.md5.value == int.from_bytes(digest[-4:], "big")
+        assert df_test.compile().pack() == df_test.pack()
+
+        with pytest.raises(DFTypeException):
+            DFDigestRef(DFBuffer(), zlib.crc32, "body")
+
+        # Hash fields cannot be compiled
+        df_test = DFContainer()
+        df_test.sha = DFDigestRef(DFBuffer(), hashlib.sha256(), "body")
+        df_test.body = DFContainer()
+        df_test.body.value = DFUInt8(value=1)
+        with pytest.raises(DFTypeException):
+            df_test.compile()
+
+
+class TestPackTo:
+    """Test streaming packs to files"""
+
+    class Sink:
+        """Write-only, non-seekable file"""
+
+        def __init__(self):
+            self.chunks = []
+
+        def write(self, data):
+            self.chunks.append(bytes(data))
+            return len(data)
+
+    def test(self, tmp_path):
+        df_test = build_message()
+        df_test.body.nested = DFLength(DFUInt8(), DFContainer())
+        df_test.body.nested.values = DFArray(DFUInt16, value=[1, 2, 3])
+        df_test.digest = DFDigestRef(DFUInt32(), zlib.crc32, "body")
+        expected = df_test.pack()
+
+        out = io.BytesIO()
+        out.write(b"xy")
+        assert df_test.pack_to(out) == len(expected)
+        assert out.tell() == 2 + len(expected)
+        assert out.getvalue()[2:] == expected
+
+        sink = self.Sink()
+        assert df_test.pack_to(sink) == len(expected)
+        assert b"".join(sink.chunks) == expected
+        # Nothing larger than a leaf is packed at once
+        assert max(len(chunk) for chunk in sink.chunks) == 6
+
+        # Seekable files can be written in one pass too
+        out = io.BytesIO()
+        assert df_test.pack_to(out, seekable=False) == len(expected)
+        assert out.getvalue() == expected
+
+        with mmap.mmap(-1, len(expected)) as mapped:
+            df_test.pack_to(mapped)
+            assert mapped[:] == expected
+
+        # Appending files only write at the end, so lengths are not patched
+        path = tmp_path / "appended"
+        path.write_bytes(b"HEAD")
+        with open(path, "ab") as file:
+            assert df_test.pack_to(file) == len(expected)
+        assert path.read_bytes() == b"HEAD" + expected
+
+        df_test.incremental = True
+        out = io.BytesIO()
+        df_test.pack_to(out)
+        assert out.getvalue() == expected
+
+        assert DFUInt16(value=0x102).pack_to(out) == 2
+        assert out.getvalue()[-2:] == b"\x02\x01"
+
+
+class TestPackIov:
+    """Test scatter-gather packing"""
+
+    def test(self):
+        payload = bytes(range(256)) * 16
+        df_test = build_message()
+        df_test.body.big = DFBuffer(value=payload)
+        df_test.body.after = DFUInt32(value=5)
+        df_test.data = DFArray(DFUInt32, value=range(512))
+        expected = df_test.pack()
+
+        segments = df_test.pack_iov()
+        assert b"".join(segments) == expected
+        assert len(segments) == 4
+        # Large payloads are not copied
+        assert segments[1].obj is payload
+        assert isinstance(segments[0], bytearray)
+
+        assert b"".join(df_test.pack_iov(min_segment=1 << 20)) == expected
+        assert len(df_test.pack_iov(min_segment=1 << 20)) == 1
+        assert df_test.pack_iov(min_segment=0)[0] == b"\x01\x00\x00\x00"
+
+        left, right = socket.socketpair()
+        with left, right:
+            assert left.sendmsg(df_test.pack_iov()) == len(expected)
+            received = b""
+            while len(received) < len(expected):
+                received += right.recv(len(expected))
+            assert received == expected
+
+
+class TestDFFileBuffer:
+    """Test file, descriptor and mmap backed buffers"""
+
+    def test(self, tmp_path):
+        payload = bytes(range(256)) * 8192
+        path = tmp_path / "payload.bin"
+        path.write_bytes(payload)
+
+        with open(path, "rb") as source:
+            fileno = source.fileno()
+            mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+            for backing, start, length in [
+                (str(path), 0, None),
+                (path, 100, 5000),
+                (fileno, 1 << 20, None),
+                (mapped, 7, 1 << 20),
+                (payload, 0, 3),
+            ]:
+                expected_payload = payload[start:]
+                if length is not None:
+                    expected_payload = expected_payload[:length]
+                df_test = DFContainer()
+                df_test.body = DFLength(DFUInt32(), DFContainer())
+                df_test.body.head = DFUInt8(value=1)
+                df_test.body.data = DFFileBuffer(backing, start, length)
+                assert df_test.body.data.nbytes == len(expected_payload)
+                expected = (
+                    (len(expected_payload) + 1).to_bytes(4, "little")
+                    + b"\x01"
+                    + expected_payload
+                )
+
+                assert df_test.pack() == expected
+                buf = bytearray(len(expected) + 2)
+                assert df_test.pack_into(buf, 2) == len(buf)
+                assert bytes(buf[2:]) == expected
+                out = io.BytesIO()
+                assert df_test.pack_to(out) == len(expected)
+                assert out.getvalue() == expected
+                assert b"".join(df_test.pack_iov()) == expected
+            # The descriptor position is left alone
+            assert source.tell() == 0
+            mapped.close()
+
+        df_test.body.data.value = b"xyz"
+        assert df_test.pack() == b"\x04\x00\x00\x00\x01xyz"
+        with pytest.raises(DFRangeException):
+            DFFileBuffer(str(path), len(payload) + 1)
+        with pytest.raises(DFRangeException):
+            DFFileBuffer(str(path), 10, len(payload))
+
+
+class TestAsyncPack:
+    """Test asynchronous chunked packing"""
+
+    def test(self):
+        df_test = build_message()
+        df_test.body.big = DFBuffer(value=bytes(range(256)) * 40)
+        df_test.values = DFArray(DFUInt16, value=range(3000))
+        expected = df_test.pack()
+
+        async def collect(chunk_size):
+            return [bytes(chunk) async for chunk in df_test.apack(chunk_size)]
+
+        for chunk_size in (1, 7, 1000, 1 << 16):
+            chunks = asyncio.run(collect(chunk_size))
+            assert b"".join(chunks) == expected
+            assert max(len(chunk) for chunk in chunks) <= chunk_size
+
+        async def send():
+            left, right = socket.socketpair()
+            reader, reader_writer = await asyncio.open_connection(sock=right)
+            _, writer = await asyncio.open_connection(sock=left)
+
+            async def write():
+                written = await df_test.write_to(writer, chunk_size=512)
+                writer.close()
+                await writer.wait_closed()
+                return written
+
+            result = await asyncio.gather(write(), reader.read())
+            reader_writer.close()
+            await reader_writer.wait_closed()
+            return tuple(result)
+
+        assert asyncio.run(send()) == (len(expected), expected)
+
+
+class TestPackParallel:
+    """Test multi-process bulk packing"""
+
+    def test(self):
+        schema = build_message()
+        plan = schema.compile()
+        rows = [(i, i % 256, bytes(i % 7), 3) for i in range(1000)]
+        expected = [plan.pack(row) for row in rows]
+
+        buf, offsets = pack_parallel(schema, rows, workers=2, batch_size=64)
+        assert len(offsets) == len(rows) + 1
+        assert bytes(buf) == b"".join(expected)
+        assert bytes(buf[offsets[10] : offsets[11]]) == expected[10]
+
+        out = io.BytesIO()
+        offsets = pack_parallel_to(plan, iter(rows), out, workers=2, batch_size=100)
+        assert out.getvalue() == b"".join(expected)
+        assert offsets[-1] == len(out.getvalue())
+
+        assert list(iter_pack_parallel(plan, rows[:5], workers=1)) == expected[:5]
+        buf, offsets = pack_parallel(schema, [], workers=1)
+        assert not buf and list(offsets) == [0]
+
+        # Fixed-width records are packed a block at a time
+        fixed = DFContainer()
+        fixed.first = DFUInt8()
+        fixed.second = DFUInt16()
+        with pytest.raises(DFRangeException):
+            pack_parallel(fixed, [(1, 2, 3), (4,)], workers=1)
+
+
+class TestFreeze:
+    """Test immutable snapshots"""
+
+    def test(self):
+        df_test = build_message()
+        expected = df_test.pack()
+        frozen = df_test.freeze()
+        assert frozen.pack() is frozen.pack()
+        assert frozen.pack() == expected
+        assert frozen.nbytes == len(expected)
+        assert frozen.seq == 1
+        assert frozen.len == 6
+        assert frozen.body.head == 2
+        assert bytes(frozen.body.buf) == b"abc"
+        assert frozen.body.pack() == df_test.body.pack()
+
+        # Later changes to the tree leave the snapshot alone
+        df_test.body.buf.value = b"abcdef"
+        df_test.extra = DFUInt8()
+        assert frozen.pack() == expected
+        assert frozen.len == 6
+
+        assert frozen == build_message().freeze()
+        assert frozen != df_test.freeze()
+        assert len({frozen, build_message().freeze(), df_test.freeze()}) == 2
+        with pytest.raises(AttributeError):
+            frozen.seq = 2
+        with pytest.raises(TypeError):
+            frozen.body.buf[0] = 1
+
+        thawed = frozen.thaw()
+        thawed.seq.value = 7
+        assert thawed.pack()[:1] == b"\x07"
+        assert frozen.seq == 1
+
+        sub = df_test.other.freeze()
+        assert sub.pack() == b"\x03\x00"
+        assert sub.thaw().parent is None
+        assert df_test.other.parent is df_test
+
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            results = pool.map(lambda _: (frozen.pack(), frozen.len), range(100))
+            assert set(results) == {(expected, 6)}
+
+
+class TestFreezeReferences:
+    """Test snapshots of trees with digests and outside references"""
+
+    def test(self):
+        # Digests copy themselves into the snapshot and back out of it
+        df_digest = DFContainer()
+        df_digest.body = DFContainer()
+        df_digest.body.buf = DFBuffer(b"abc")
+        df_digest.sha = DFDigestRef(DFBuffer(), hashlib.sha256(), "body")
+        frozen = df_digest.freeze()
+        assert bytes(frozen.sha) == hashlib.sha256(b"abc").digest()
+        thawed = frozen.thaw()
+        thawed.body.buf.value = b"abcd"
+        assert thawed.sha.value == hashlib.sha256(b"abcd").digest()
+        assert frozen.pack() == df_digest.pack()
+
+        # References out of a frozen branch are followed in the full tree
+        df_split = DFContainer()
+        df_split.hdr = DFContainer()
+        df_split.hdr.len = DFLengthRef(DFUInt8(), "body")
+        df_split.body = DFContainer()
+        df_split.body.buf = DFBuffer(b"abcd")
+        frozen = df_split.hdr.freeze()
+        assert frozen.pack() == b"\x04"
+        assert frozen.len == 4
+        with pytest.raises(DFTypeException):
+            frozen.thaw()
+
+        # References within a frozen branch come back with it
+        frozen = df_split.freeze()
+        thawed = frozen.thaw()
+        thawed.body.buf.value = b"xyz"
+        assert thawed.pack() == b"\x03xyz"
+        assert frozen.pack() == b"\x04abcd"
+
+
+class TestProfiler:
+    """Test per-node pack instrumentation"""
+
+    def test(self):
+        df_test = build_message()
+        pack = DFContainer.pack
+        with DFProfiler() as profiler:
+            expected = df_test.pack()
+            # Computing the checksum outside a pack serializes body again
+            assert df_test.crc.value == csum(df_test.body.pack())
+            with pytest.raises(DFTypeException):
+                DFProfiler().start()
+        assert DFContainer.pack is pack
+        assert df_test.pack() == expected
+
+        stats = {row["path"]: row for row in profiler.stats()}
+        assert stats["<root>"]["calls"] == 1
+        assert stats["<root>"]["nbytes"] == len(expected)
+        assert stats["body"]["calls"] == 3
+        assert stats["body._data.buf"]["nbytes"] == 9
+        assert stats["body._field"]["calls"] == 3
+        assert stats["crc"]["resolutions"] >= 2
+        assert stats["<root>"]["cumulative"] >= stats["<root>"]["self"]
+        rows = profiler.stats()
+        assert rows == sorted(rows, key=lambda row: row["self"], reverse=True)
+
+        assert "body._data.head" in profiler.report()
+        assert len(profiler.report(limit=2).splitlines()) == 3
+        lines = profiler.collapsed().splitlines()
+        assert "<root>;body;body._data;body._data.buf" in [
+            line.rsplit(" ", 1)[0] for line in lines
+        ]
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+        # Lengths patched after a pack_to count as part of it
+        with DFProfiler() as profiler:
+            assert df_test.pack_to(io.BytesIO()) == len(expected)
+        stats = {row["path"]: row for row in profiler.stats()}
+        assert stats["<root>"]["calls"] == 1
+        assert stats["<root>"]["nbytes"] == len(expected)
+
+
+class Inner(DFStruct):
+    """Fixed-size struct nested in Message"""
+
+    kind = DFUInt8(value=1)
+    code = DFUInt16(endian=DFEndian.BIG, value=2)
+
+
+class Message(DFStruct):
+    """Struct with every supported kind of field"""
+
+    magic = DFUInt32(endian=DFEndian.BIG, value=0xFEEDFACE)
+    length = DFLengthRef(DFUInt16(), "payload")
+    count = DFCountRef(DFUInt8(), "values")
+    values = DFArray(DFUInt16)
+    inner = Inner()
+    payload = DFBuffer()
+    tail = DFUInt16(value=7)
+
+
+class TestDFStruct:
+    """Test declarative structs with generated code"""
+
+    def test(self):
+        msg = Message(values=[1, 2, 3], payload=b"hello")
+        expected = (
+            b"\xfe\xed\xfa\xce\x05\x00\x03\x01\x00\x02\x00\x03\x00"
+            b"\x01\x00\x02hello\x07\x00"
+        )
+        assert msg.pack() == expected
+        assert msg.nbytes == len(expected)
+        assert msg.to_container().pack() == expected
+        assert Inner._fixed_size == 3 and Message._fixed_size is None
+
+        buf = bytearray(len(expected) + 1)
+        assert msg.pack_into(buf, 1) == len(buf)
+        assert bytes(buf[1:]) == expected
+        with pytest.raises(DFRangeException):
+            msg.pack_into(bytearray(10))
+
+        decoded = Message()
+        assert decoded.unpack(buf, 1) == len(buf)
+        assert decoded == msg
+        assert decoded.inner == Inner()
+        assert list(decoded.values) == [1, 2, 3]
+        with pytest.raises(DFRangeException):
+            Message().unpack(expected[:-1])
+
+        # Defaults are not shared between instances
+        first, second = Message(), Message()
+        first.values.append(9)  # pylint: disable=no-member
+        first.inner.kind = 5
+        assert len(second.values) == 0 and second.inner.kind == 1
+        with pytest.raises(AttributeError):
+            first.missing = 1  # pylint: disable=attribute-defined-outside-init
+
+        # A buffer without a length takes the rest, less fixed-size fields
+        class Trailer(Inner):
+            """Buffer sized by the fixed-size fields after it"""
+
+            data = DFBuffer()
+            crc = DFUInt32(value=0xAABBCCDD)
+
+        trailer = Trailer(data=b"xyz")
+        assert trailer.pack() == b"\x01\x00\x02xyz\xdd\xcc\xbb\xaa"
+        decoded = Trailer()
+        decoded.unpack(trailer.pack())
+        assert decoded == trailer
+
+        with pytest.raises(DFTypeException):
+
+            class Computed(DFStruct):  # pylint: disable=unused-variable
+                """Callable references are not supported"""
+
+                crc = DFCallableRef(DFUInt16(), csum, "data")
+                data = DFBuffer()
+
+        with pytest.raises(DFTypeException):
+
+            class Missing(DFStruct):  # pylint: disable=unused-variable
+                """Length of a field that does not exist"""
+
+                length = DFLengthRef(DFUInt16(), "data")
+
+
+class TestStreamingPrint:
+    """Test streaming pretty printing and annotated hexdumps"""
+
+    def test(self):
+        df_test = build_message()
+        expected = (
+            "+None\n"
+            "| |- Unsigned Long 0x00000001 : seq \n"
+            "| +len length: 0x6\n"
+            "| +crc value: 0x12c\n"
+            "| +body length: 0x4\n"
+            "|  |- Unsigned Byte 0x02 : head \n"
+            "|  |- Buffer b'616263' : buf \n"
+            "| +other\n"
+            "|  |- Unsigned Short 0x0003 : count \n"
+        )
+        assert df_test.pretty_print() == expected
+
+        stream = io.StringIO()
+        df_test.write_pretty(stream, offsets=True)
+        lines = stream.getvalue().splitlines()
+        assert lines[0] == "00000000       16 +None"
+        assert lines[4] == "00000008        6 | +body length: 0x4"
+        assert lines[6] == "0000000b        3 |  |- Buffer b'616263' : buf "
+
+        # Cached branches are located from their bytes
+        df_test.incremental = True
+        df_test.pack()
+        stream = io.StringIO()
+        df_test.write_hexdump(stream, width=4, limit=2)
+        assert stream.getvalue() == (
+            "00000000  01 00        ..    seq\n"
+            "          ... 2 more bytes\n"
+            "00000004  06 00        ..    len\n"
+            "00000006  2c 01        ,.    crc\n"
+            "00000008  04 00        ..    body._field\n"
+            "0000000a  02           .     body._data.head\n"
+            "0000000b  61 62        ab    body._data.buf\n"
+            "          ... 1 more bytes\n"
+            "0000000e  03 00        ..    other.count\n"
+        )
+
+        stream = io.StringIO()
+        df_test.write_hexdump(stream)
+        assert "00000000  01 00 00 00" in stream.getvalue()
+
+
+BUILDS = []
+
+CACHED_COUNT = 1
+
+
+def build_cached_message():
+    BUILDS.append(None)
+    return build_message()
+
+
+class TestSchemaCache:
+    """Test the on-disk schema cache"""
+
+    def test(self, tmp_path):
+        expected = build_message().pack()
+        BUILDS.clear()
+        first = cached_schema(build_cached_message, tmp_path / "cache")
+        assert len(BUILDS) == 1
+        second = cached_schema(build_cached_message, tmp_path / "cache")
+        assert len(BUILDS) == 1
+        assert second is not first
+        assert first.pack() == second.pack() == expected
+
+        # Loaded references resolve within the loaded tree
+        second.body.buf.value = b"abcdef"
+        assert second.len.value == 9
+        assert first.len.value == 6
+
+        # A different definition or a damaged file is rebuilt
+        cached_schema(build_cached_message, tmp_path / "cache", extra="v2")
+        assert len(BUILDS) == 2
+        (path,) = (tmp_path / "cache").iterdir()
+        path.write_bytes(path.read_bytes()[:40])
+        assert cached_schema(build_cached_message, tmp_path / "cache").pack() == (
+            expected
+        )
+        assert len(BUILDS) == 3
+
+        key = schema_key(build_cached_message)
+        assert load_schema(path, key).pack() == expected
+        with pytest.raises(DFTypeException):
+            load_schema(path, schema_key(build_cached_message, "v2"))
+
+        save_schema(build_message().compile(), tmp_path / "plan", key)
+        plan = load_schema(tmp_path / "plan", key)
+        assert isinstance(plan, DFPackPlan)
+        assert plan.pack() == expected
+
+    @pytest.mark.skipif(not hasattr(os, "getuid"), reason="needs POSIX owners")
+    def test_writable_by_others(self, tmp_path):
+        path = tmp_path / "schema"
+        save_schema(build_message(), path)
+        assert load_schema(path).pack() == build_message().pack()
+        path.chmod(0o666)
+        with pytest.raises(DFTypeException):
+            load_schema(path)
+
+        # The cache rebuilds such an entry and replaces it with a private one
+        BUILDS.clear()
+        cached_schema(build_cached_message, tmp_path / "cache")
+        (path,) = (tmp_path / "cache").iterdir()
+        path.chmod(0o664)
+        cached_schema(build_cached_message, tmp_path / "cache")
+        assert len(BUILDS) == 2
+        assert not path.stat().st_mode & 0o077
+
+    def test_key(self, monkeypatch):
+        def build_sized(size):
+            def build():
+                df_test = DFContainer()
+                df_test.data = DFArray(DFUInt8, size * CACHED_COUNT)
+                return df_test
+
+            return build
+
+        key = schema_key(build_sized(2))
+        assert schema_key(build_sized(2)) == key
+        assert schema_key(build_sized(3)) != key
+        monkeypatch.setitem(globals(), "CACHED_COUNT", 2)
+        assert schema_key(build_sized(2)) != key
+        assert schema_key(build_sized(2), "v2") != schema_key(build_sized(2))
+
+
 def csum(data: bytes) -> int:
     checksum = 0
     for value in data:
@@ -282,7 +1477,7 @@ def csum(data: bytes) -> int:
     return checksum
 
 
-class TestDFCallableRef():
+class TestDFCallableRef:
     """Test callable ref container"""
 
     def test(self):
@@ -314,7 +1509,7 @@ class TestDFCallableRef():
         df_test.sub1.sub2.csum_data.data2 = DFUInt8(value=10)
         # print(df_test.pretty_print())
         # print(df_test.pack())
-        assert(
+        assert (
             b"\x11\x07\x00\x18\x03\x09\x00\x00\x00\xdd\xcc\xbb\xaa\x0a"
             == df_test.pack()
         )